@@ -2,69 +2,62 @@
 import streamlit as st
 import pandas as pd
 import logic
+import logic_cache
+import planner
+import ranking
 import database as db
-import matplotlib.pyplot as plt
+import write_queue
+import store_config
+import profiler
 import importlib
+import json
+import os
 
-# Force reload logic module to pick up changes
-importlib.reload(logic)
-importlib.reload(db)
+# Dev mode (PACHINKO_DEV=1): reload edited modules on every rerun
+DEV_MODE = os.environ.get("PACHINKO_DEV", "") not in ("", "0")
+if DEV_MODE:
+    importlib.reload(logic)
+    importlib.reload(db)
+
+# Optional instrumentation (PACHINKO_PROFILE=1): per-section and per-query timings
+profiler.enable_from_env(db)
+profiler.start_run("app")
 
 st.set_page_config(page_title="ホール別　実践データ管理表", layout="wide")
 
-# Init DB
-db.init_db()
+# Cached reads: keyed on the data version of the store, which every committed
+# write in this process bumps, so a rerun without new data issues no SQL.
+# The ttl picks up writes made by other processes (e.g. importer.py).
+READ_CACHE_TTL = 60
 
-st.title("🌊 ホール別　実践データ管理表")
+@st.cache_data(ttl=READ_CACHE_TTL, max_entries=256, show_spinner=False)
+def cached_read(func_name, version, *args, **kwargs):
+    return getattr(db, func_name)(*args, **kwargs)
 
-# Store Configuration
-# Define ranges with exclusion logic (4 and 9)
-def generate_range_exclude_49(start, end):
-    return [i for i in range(start, end + 1) if i % 10 not in (4, 9)]
+def read(func_name, store_id, *args, **kwargs):
+    return cached_read(func_name, db.data_version(store_id), store_id, *args, **kwargs)
+
+st.title("🌊 ホール別　実践データ管理表")
 
-sh_alta = generate_range_exclude_49(1551, 1561) + generate_range_exclude_49(1650, 1660)
-sh_agnes = list(range(1837, 1839))
-sh_shinkai = list(range(1850, 1852))
+@st.cache_resource(show_spinner=False)
+def bootstrap(db_path):
+    """
+    One-time setup per process: schema, and on a database without store
+    configuration the stores / islands from store_config.json. Later
+    configuration changes go through store_config (sidebar or CLI).
+    """
+    db.init_db()
+    if not store_config.is_seeded():
+        store_config.apply_config(store_config.load_config())
+    return True
 
-STORE_CONFIG = {
-    "ラフェスタ 5": list(range(987, 1005)),
-    "999": list(range(81, 85)) + list(range(86, 88)) + list(range(93, 101)) + list(range(141, 149)),
-    "スーパーハリウッド1000": sh_alta + sh_agnes + sh_shinkai
-}
+bootstrap(db.DB_PATH)
 
 # Sidebar: Inputs and Machine Selection
 st.sidebar.header("台データ入力")
 
-# 1. Rename "Default Store" if exists
-db.rename_store("Default Store", "ラフェスタ 5")
-
-# 2. Ensure stores exist
-db.add_store("999", 28.0)
-db.add_store("スーパーハリウッド1000", 28.0)
-
-# 3. Store Selection
-# ... (existing code) ...
-
-# ... (inside STORE_MODEL_CONFIG) ...
-STORE_MODEL_CONFIG = {
-    "999": {
-        "P大海物語5スペシャル ALTA": list(range(93, 101)) + list(range(141, 149)),
-        "PA大海物語5 With アグネス･ラム ARBC": list(range(81, 85)),
-        "PA大海物語4スペシャル RBA": list(range(86, 88))
-    },
-    "スーパーハリウッド1000": {
-        "P大海物語5スペシャル ALTA": sh_alta,
-        "PA大海物語5 With アグネス･ラム ARBC": sh_agnes,
-        "PA新海物語 ARBB": sh_shinkai
-    }
-}
-
-
-# 3. Store Selection
-stores = db.get_stores()
-if stores.empty:
-    db.add_store("ラフェスタ 5", 27.0)
-    stores = db.get_stores()
+# Store Selection
+stores = cached_read("get_stores", db.data_version())
 
 store_names = stores['name'].tolist()
 # Filter only configured stores or show all? Let's show all in DB but config applies to known ones.
@@ -77,56 +70,41 @@ rate = float(store_row['exchange_rate'])
 # Machine Selection
 st.sidebar.subheader("台選択")
 
-# Ensure machines for selected store
-if selected_store_name in STORE_CONFIG:
-    target_machines = STORE_CONFIG[selected_store_name]
-    db.ensure_machines(store_id, target_machines)
-    machine_list = sorted(target_machines)
-else:
-    # Fallback or other stores
-    machine_list = db.get_all_machine_numbers(store_id)
-    if not machine_list:
-        machine_list = [1] # Dummy
+# Machines, islands and calculator settings of the store (in-memory index, O(1) lookups)
+store_index = db.get_store_index(store_id)
+store_groups = store_index["groups"]
+machine_list = list(store_index["machines"]) or [1] # Dummy
 
 m_num = st.sidebar.selectbox("台番号", machine_list)
 
+# Stats window (None = lifetime); windowed stats are summed from the daily rollup
+STATS_WINDOWS = {"全期間": None, "直近7日": 7, "直近30日": 30, "直近90日": 90}
+stats_window = st.sidebar.selectbox("集計期間", list(STATS_WINDOWS))
+stats_days = STATS_WINDOWS[stats_window]
+window_label = f" [{stats_window}]" if stats_days else ""
+
+profiler.checkpoint("setup")
+
+# Read-your-writes: wait for a record queued by the previous rerun to commit
+pending_save = st.session_state.pop("pending_save", None)
+if pending_save is not None:
+    try:
+        # Both the record and the remarks reset must have committed (each runs in its own savepoint)
+        for future in pending_save:
+            future.result(timeout=30)
+        st.session_state["record_success"] = True
+    except Exception as e:
+        st.session_state["record_error"] = f"保存に失敗しました: {e}"
+
 # Get Machine Stats & Weighted Averages
-mid, _ = db.get_or_create_machine(store_id, m_num)
 # Now returns 7 values including record_count
-w_base, w_out, t_spins, t_inv, t_out, t_hits, rec_count = db.get_machine_weighted_stats(store_id, m_num)
+w_base, w_out, t_spins, t_inv, t_out, t_hits, rec_count = read("get_machine_weighted_stats", store_id, m_num, stats_days)
 
 # 1. Determine Model (Island) for the selected machine
-current_model_name = "不明"
-current_model_machines = []
-
-# Move model config definition up or refer to a consolidated one
-# Let's use the one at the bottom, or just define it here.
-# Actually, the one at the bottom is for display grouping. I should unify them.
-MODEL_GROUPS = {
-    "999": {
-        "P大海物語5スペシャル ALTA": list(range(93, 101)) + list(range(141, 149)),
-        "PA大海物語5 With アグネス･ラム ARBC": list(range(81, 85)),
-        "PA大海物語4スペシャル RBA": list(range(86, 88))
-    },
-    "スーパーハリウッド1000": {
-        "P大海物語5スペシャル ALTA": sh_alta,
-        "PA大海物語5 With アグネス･ラム ARBC": sh_agnes,
-        "PA新海物語 ARBB": sh_shinkai
-    },
-    "ラフェスタ 5": {
-        "大海4SP": STORE_CONFIG["ラフェスタ 5"]
-    }
-}
-
-if selected_store_name in MODEL_GROUPS:
-    for mname, mnums in MODEL_GROUPS[selected_store_name].items():
-        if m_num in mnums:
-            current_model_name = mname
-            current_model_machines = mnums
-            break
+current_model_name = store_index["model_of"].get(m_num, "不明")
 
 # 2. Get Island Stats
-i_base, i_out, _, _, _, _, i_rec_count = db.get_model_weighted_stats(store_id, current_model_machines)
+i_base, i_out, _, _, _, _, i_rec_count = read("get_group_weighted_stats", store_id, current_model_name, stats_days)
 
 # Helper to safely convert text to numeric
 def safe_to_num(val, is_int=True):
@@ -145,12 +123,15 @@ def save_record_callback(st_id, machine_num):
 
     if v_spins > 0:
         inv_balls = v_inv * 250
-        db.add_record(st_id, machine_num, inv_balls, v_spins, v_hits, v_out)
-        db.update_machine_remarks(st_id, machine_num, "")
+        # Queued to the background writer; the rerun waits for the commit before reading
+        writer = write_queue.get_write_queue()
+        st.session_state["pending_save"] = (
+            writer.submit(db.add_record, st_id, machine_num, inv_balls, v_spins, v_hits, v_out, key=(st_id, machine_num)),
+            writer.submit(db.update_machine_remarks, st_id, machine_num, "", key=(st_id, machine_num)),
+        )
         # Reset inputs
         for k in ["input_inv", "input_spins", "input_hits", "input_out", "input_remarks"]:
             st.session_state[k] = ""
-        st.session_state["record_success"] = True
     else:
         st.session_state["record_error"] = "回転数を入力してください。"
 
@@ -163,23 +144,35 @@ def delete_record_callback(r_id, label_text):
     if db.delete_record_by_id(r_id):
         st.session_state["del_msg"] = f"{label_text} を削除しました。"
 
+def apply_config_callback():
+    config_file = st.session_state.get("store_config_file")
+    if config_file is None:
+        st.session_state["config_error"] = "設定ファイルを選択してください。"
+        return
+    try:
+        changed = store_config.apply_config(store_config.parse_config(json.loads(config_file.getvalue())))
+    except ValueError as e:
+        st.session_state["config_error"] = f"設定ファイルが不正です: {e}"
+        return
+    st.session_state["config_msg"] = f"{len(changed)}店舗の設定を適用しました。"
+
 # 3. Sidebar Display: Stats
 if rec_count > 0:
     st.sidebar.info(f"""
-    **台#{m_num} 実践平均** ({rec_count}回)
+    **台#{m_num} 実践平均{window_label}** ({rec_count}回)
     - **ベース**: {w_base:.1f} ({t_spins:.0f} / {t_inv/250:.1f})
     - **出玉**: {w_out:.0f} ({t_out:.0f} / {t_hits:.1f})
     """)
 
 if i_rec_count > 0:
     st.sidebar.success(f"""
-    **シマ平均 [{current_model_name}]** ({i_rec_count}回)
+    **シマ平均 [{current_model_name}]{window_label}** ({i_rec_count}回)
     - **ベース**: {i_base:.1f}
     - **出玉**: {i_out:.0f}
     """)
 
 # 4. Remarks Input
-current_remarks = db.get_machine_remarks(store_id, m_num)
+current_remarks = read("get_machine_remarks", store_id, m_num)
 st.sidebar.text_area("備考", current_remarks, key="input_remarks")
 st.sidebar.button("備考を保存", on_click=save_remarks_callback, args=(store_id, m_num))
 if st.session_state.get("remarks_success"):
@@ -189,7 +182,7 @@ if st.session_state.get("remarks_success"):
 # 5. History Management
 st.sidebar.markdown("---")
 st.sidebar.subheader("履歴管理 (最新5件)")
-history_df = db.get_machine_history(store_id, m_num, limit=5)
+history_df = read("get_machine_history", store_id, m_num, limit=5)
 if not history_df.empty:
     for idx, row in history_df.iterrows():
         rid = row['id']
@@ -222,33 +215,34 @@ if st.session_state.get("record_error"):
     st.sidebar.error(st.session_state["record_error"])
     del st.session_state["record_error"]
 
+# 6. Store configuration import (admin): same JSON format as store_config.json
+with st.sidebar.expander("⚙ 店舗設定"):
+    st.file_uploader("設定ファイル (JSON)", type="json", key="store_config_file")
+    st.button("設定を適用", on_click=apply_config_callback)
+    if st.session_state.get("config_msg"):
+        st.success(st.session_state.pop("config_msg"))
+    if st.session_state.get("config_error"):
+        st.error(st.session_state.pop("config_error"))
+
+profiler.checkpoint("sidebar")
+
 # Main Area: Calculator
-# Dynamic Settings based on Store
-if selected_store_name == "ラフェスタ 5":
-    calc_title = "大海4SP 期待値計算"
-    calc_model = "大海4SP"
-    default_rate = float(rate) # Typically 27.0
-    default_out_std = 1400
-else:
-    # Fixed title for non-Lafesta stores as requested
-    calc_title = "P大海物語5スペシャル ALTA 期待値計算"
-    calc_model = "大海5SP"
-    default_rate = 27.5
-    default_out_std = 1400
+# Dynamic Settings based on Store (store_settings; unconfigured stores use the ALTA defaults)
+DEFAULT_CALC = {"calc_group": "P大海物語5スペシャル ALTA", "calc_model": "大海5SP", "default_rate": 27.5, "default_out": 1400}
+calc_settings = store_index["settings"] or DEFAULT_CALC
+# Strictly use model-wide (island) average for the calculated model
+calc_group = calc_settings["calc_group"]
+calc_model = calc_settings["calc_model"]
+calc_title = f"{calc_group} 期待値計算"
+default_rate = float(rate if calc_settings["default_rate"] is None else calc_settings["default_rate"])
+default_out_std = calc_settings["default_out"]
 
 st.subheader(calc_title)
 
 # Calculator Inputs
-# Fix: Strictly use model-wide (island) average for the calculated model
-calc_model_machines = MODEL_GROUPS.get(selected_store_name, {}).get(calc_title.replace(" 期待値計算", ""), [])
-if not calc_model_machines: # Fallback for title mismatches
-    if "大海4SP" in calc_title:
-        calc_model_machines = MODEL_GROUPS.get(selected_store_name, {}).get("大海4SP", [])
-    else:
-        calc_model_machines = MODEL_GROUPS.get(selected_store_name, {}).get("P大海物語5スペシャル ALTA", [])
 
 # Fetch stats specifically for the model being calculated
-c_base, c_out, _, _, _, _, c_rec_count = db.get_model_weighted_stats(store_id, calc_model_machines)
+c_base, c_out, _, _, _, _, c_rec_count = read("get_group_weighted_stats", store_id, calc_group, stats_days)
 
 col_input1, col_input2, col_input3, col_input4 = st.columns(4)
 with col_input1:
@@ -273,10 +267,10 @@ with col_input4:
     default_out_final = max(1300.0, min(1550.0, val_out))
     cur_avg_out = st.number_input("平均出玉", 1300, 1550, int(default_out_final), step=5) 
 
-# Calculate using the selected model
-exp_val = logic.calculate_expectation(cur_base, cur_spins, cur_rate, cur_avg_out, calc_model)
-est_time = logic.get_estimated_time(cur_spins, calc_model)
-avg_hits = logic.get_expected_hits(cur_spins, calc_model)
+# Calculate using the selected model (memoized across reruns and sessions)
+exp_val = logic_cache.calculate_expectation(cur_base, cur_spins, cur_rate, cur_avg_out, calc_model)
+est_time = logic_cache.get_estimated_time(cur_spins, calc_model)
+avg_hits = logic_cache.get_expected_hits(cur_spins, calc_model)
 hourly_wage = int((exp_val / est_time) * 60)
 
 # Display Results - 2x2 grid for mobile compatibility
@@ -288,27 +282,111 @@ with col_res2:
     st.metric("時給 (見込)", f"¥{hourly_wage:,}")
     st.metric("平均連荘", f"{avg_hits:.2f}回")
 
+# Stop / continue plan (backward induction over remaining spins, cached per model/rate/out)
+plan = planner.plan_session(cur_spins, cur_base, cur_rate, cur_avg_out, calc_model)
+if plan["play"]:
+    st.success(f"続行推奨: 最適期待値 ¥{plan['value']:,} (ベース{cur_base:.1f}なら残り{plan['max_play_spins']}回転以下で続行)")
+elif plan["max_play_spins"] > 0:
+    st.warning(f"撤退推奨: ベース{cur_base:.1f}では残り{plan['max_play_spins']}回転以下から続行が有利")
+else:
+    st.warning(f"撤退推奨: ベース{cur_base:.1f}ではどの残り回転数でも期待値がプラスになりません")
+
+# EV Surface (Base x Remaining Spins)
+SURFACE_BASES = [round(10.0 + 0.1 * i, 1) for i in range(200)]   # 10.0 - 29.9
+SURFACE_SPINS = list(range(10, 1501, 10))                        # 10 - 1500
+
+@st.cache_data(max_entries=32)
+def get_ev_surface(rate_val, avg_out_val, model_type):
+    # One vectorized evaluation; cached until rate / average out / model change
+    ev, hourly = logic.expectation_surface(SURFACE_BASES, SURFACE_SPINS, rate_val, avg_out_val, model_type)
+    return ev, hourly
+
+# Lazy: the surface and matplotlib (slow to import) only load once the expander is opened
+with st.expander("📈 期待値マトリクス (ベース × 残り回転数)", key="ev_surface_open", on_change="rerun") as ev_surface:
+    if ev_surface.open:
+        import matplotlib.pyplot as plt
+
+        surface_kind = st.radio("表示", ["期待値", "時給"], horizontal=True, key="surface_kind")
+        ev_grid, wage_grid = get_ev_surface(float(cur_rate), float(cur_avg_out), calc_model)
+        grid_vals = ev_grid if surface_kind == "期待値" else wage_grid
+
+        fig, ax = plt.subplots(figsize=(8, 5))
+        lim = max(abs(int(grid_vals.min())), abs(int(grid_vals.max())), 1)
+        im = ax.imshow(grid_vals, origin="lower", aspect="auto", cmap="RdYlGn", vmin=-lim, vmax=lim,
+                       extent=[SURFACE_BASES[0], SURFACE_BASES[-1], SURFACE_SPINS[0], SURFACE_SPINS[-1]])
+        ax.contour(SURFACE_BASES, SURFACE_SPINS, grid_vals, levels=[0], colors="black", linewidths=1)
+        ax.plot([cur_base], [cur_spins], marker="x", color="blue")
+        ax.set_xlabel("Base")
+        ax.set_ylabel("Remaining spins")
+        fig.colorbar(im, ax=ax, label="Yen" if surface_kind == "期待値" else "Yen / hour")
+        st.pyplot(fig)
+        plt.close(fig)
+
+        surface_df = pd.DataFrame(grid_vals, index=SURFACE_SPINS, columns=[f"{b:.1f}" for b in SURFACE_BASES])
+        surface_df.index.name = "残り回転数"
+        st.dataframe(surface_df, use_container_width=True, height=400)
+
 st.divider()
 
 # Result Input
 # ... (omitted parts) ...
 
+profiler.checkpoint("calculator")
+
 # Machine Statistics Section (Bottom)
 st.divider()
 
+# Store Ranking: EV / hourly wage for every machine at the calculator's remaining spins
+st.subheader("🏆 台ランキング")
+rank_groups = store_groups
+col_rank1, col_rank2, col_rank3 = st.columns(3)
+with col_rank1:
+    rank_models = st.multiselect("機種", list(rank_groups.keys()), key="rank_models")
+with col_rank2:
+    rank_sort = st.selectbox("並び順", ["時給", "期待値"], key="rank_sort")
+with col_rank3:
+    rank_min_ev = st.number_input("最低期待値", -100000, 100000, -100000, step=1000, key="rank_min_ev")
+
+# Aggregates are cached per data version; input changes only re-run the EV pass
+rank_rows = ranking.rank_machines(
+    read("get_store_machine_aggregates", store_id), rank_groups, cur_spins, cur_rate,
+    default_model=None if rank_groups else calc_model,
+    models=rank_models or None,
+    min_ev=rank_min_ev,
+    sort_by="hourly" if rank_sort == "時給" else "ev"
+)
+if rank_rows:
+    source_label = {"machine": "台", "island": "シマ", "default": "初期値"}
+    df_rank = pd.DataFrame([{
+        "番号": r["machine_number"],
+        "機種": r["model"],
+        "ベース": f"{r['base']:.1f} ({source_label[r['base_source']]})",
+        "出玉": int(r["avg_out"]),
+        "期待値": f"¥{r['ev']:,}" if r["ev"] is not None else "未対応",
+        "時給": f"¥{r['hourly']:,}" if r["hourly"] is not None else "-",
+        "備考": r["remarks"]
+    } for r in rank_rows])
+    st.dataframe(df_rank, hide_index=True, use_container_width=True)
+else:
+    st.info("データがありません。")
+
+st.divider()
+
+profiler.checkpoint("ranking")
+
 # Machine Statistics Section (Bottom) - Full List
-st.subheader("📊 全台データ一覧")
-all_stats = db.get_all_machines_status(store_id)
+st.subheader(f"📊 全台データ一覧{window_label}")
+all_stats = read("get_all_machines_status", store_id, stats_days)
 
-# Model Configuration for display grouping (Using MODEL_GROUPS defined above)
+# Display grouping by island
 if all_stats:
     df_all = pd.DataFrame(all_stats)
     
     # Check if we have specific model grouping for this store
-    if selected_store_name in MODEL_GROUPS:
-        model_map = MODEL_GROUPS[selected_store_name]
+    if store_groups:
+        group_stats = read("get_store_group_stats", store_id, stats_days)
         
-        for model_name, machine_nums in model_map.items():
+        for model_name, machine_nums in store_groups.items():
             # Filter df for these machines
             df_model = df_all[df_all["番号"].isin(machine_nums)].copy()
             
@@ -316,7 +394,7 @@ if all_stats:
                 st.markdown(f"**{model_name}**")
                 
                 # Calculate Model Summary (Island Stats)
-                m_base, m_out, m_spins, m_inv, m_out_balls, m_hits, m_count = db.get_model_weighted_stats(store_id, machine_nums)
+                m_base, m_out, m_spins, m_inv, m_out_balls, m_hits, m_count = group_stats.get(model_name) or read("get_group_weighted_stats", store_id, model_name, stats_days)
                 if m_count > 0:
                     m_inv_units = m_inv / 250.0
                     summary_df = pd.DataFrame([{
@@ -348,3 +426,9 @@ if all_stats:
 else:
     st.info("データがありません。")
 
+profiler.checkpoint("all_machines")
+profile = profiler.end_run()
+if profile:
+    with st.expander(f"🛠 計測 ({profile['total_ms']:.0f} ms / SQL {profile['statements']}件 / 接続 {profile['connections']})"):
+        st.dataframe(pd.DataFrame([{"区間": k, "ms": v} for k, v in profile["sections"].items()]), hide_index=True)
+        st.dataframe(pd.DataFrame([dict(関数=k, **v) for k, v in profile["calls"].items()]), hide_index=True)
@@ -0,0 +1,101 @@
+"""
+Query benchmark for the machine_id indexes (schema migration 3).
+
+Builds a throwaway database with N records, times the per-machine access
+patterns before and after the indexes are created, and prints the result.
+
+    python bench_db.py --records 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import database as db
+
+QUERIES = {
+    "history (ORDER BY id DESC LIMIT 5)":
+        "SELECT id, date, investment_balls/250.0, spins, hits, out_balls, base_calculated, out_10r_calculated "
+        "FROM records WHERE machine_id=? ORDER BY id DESC LIMIT 5",
+    "last record (delete_last_record)":
+        "SELECT * FROM records WHERE machine_id=? ORDER BY id DESC LIMIT 1",
+    "last deleted (restore_last_record)":
+        "SELECT * FROM deleted_records WHERE machine_id=? ORDER BY id DESC LIMIT 1",
+    "machine rescan (update_machine_stats)":
+        "SELECT SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id) FROM records WHERE machine_id=?",
+}
+
+def populate(n_records, n_machines, seed=0):
+    rnd = random.Random(seed)
+    with db.transaction() as c:
+        c.execute("INSERT INTO stores (name, exchange_rate) VALUES ('bench', 27.0)")
+        c.executemany("INSERT INTO machines (store_id, machine_number) VALUES (1, ?)",
+                      [(i,) for i in range(1, n_machines + 1)])
+    batch = 100000
+    for start in range(0, n_records, batch):
+        rows = [(rnd.randint(1, n_machines), '2026-01-01', 5000, rnd.randint(200, 600), rnd.randint(0, 5),
+                 rnd.randint(0, 8000), 20.0, 1400.0) for _ in range(min(batch, n_records - start))]
+        with db.transaction() as c:
+            c.executemany("INSERT INTO records (machine_id, date, investment_balls, spins, hits, out_balls, "
+                          "base_calculated, out_10r_calculated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    deleted = [(i, rnd.randint(1, n_machines), '2026-01-01', 5000, 400, 2, 2800, 20.0, 1400.0)
+               for i in range(n_records // 10)]
+    with db.transaction() as c:
+        c.executemany("INSERT INTO deleted_records (original_record_id, machine_id, date, investment_balls, spins, "
+                      "hits, out_balls, base_calculated, out_10r_calculated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", deleted)
+
+def time_queries(n_machines, repeat, seed=1):
+    rnd = random.Random(seed)
+    mids = [rnd.randint(1, n_machines) for _ in range(repeat)]
+    result = {}
+    with db.connection() as conn:
+        c = conn.cursor()
+        for label, sql in QUERIES.items():
+            start = time.perf_counter()
+            for mid in mids:
+                c.execute(sql, (mid,))
+                c.fetchall()
+            result[label] = (time.perf_counter() - start) / repeat * 1000.0
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(tmp_dir, 'bench.db')
+    try:
+        db.migrate(target_version=2)   # schema without the machine_id indexes
+        t0 = time.perf_counter()
+        populate(args.records, args.machines)
+        print(f"populated {args.records:,} records / {args.machines:,} machines in {time.perf_counter() - t0:.1f}s")
+
+        before = time_queries(args.machines, args.repeat)
+        t0 = time.perf_counter()
+        db.migrate()
+        print(f"migration to v{db.SCHEMA_VERSION} (indexes) took {time.perf_counter() - t0:.1f}s")
+        after = time_queries(args.machines, args.repeat)
+
+        t0 = time.perf_counter()
+        db.init_db()
+        first = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        db.init_db()
+        fast = time.perf_counter() - t0
+
+        print(f"{'query':42s} {'before ms':>10s} {'after ms':>10s} {'speedup':>9s}")
+        for label in QUERIES:
+            print(f"{label:42s} {before[label]:10.3f} {after[label]:10.3f} {before[label] / max(after[label], 1e-9):8.0f}x")
+        print(f"init_db: first call {first * 1000:.2f} ms, fast path {fast * 1000:.4f} ms")
+    finally:
+        db.close_connections()
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Cold-start import benchmark with a time budget.
+
+Imports each target in a fresh interpreter under `python -X importtime`,
+sums the cumulative time of the top-level imports (interpreter startup
+excluded), keeps the best of N runs and compares it with the budget.
+Also checks that modules which must stay light do not pull in pandas /
+matplotlib. Exits non-zero on any regression.
+
+    python bench_import.py --repeat 5
+    python bench_import.py --scale 2      # budgets x2 on a slow machine
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def app_imports():
+    """
+    Top-level imports of app.py (what a server start pays before the first page).
+    """
+    with open(os.path.join(HERE, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.append(node.module)
+    return names
+
+# label -> (modules to import, budget ms, modules that must not be imported)
+TARGETS = {
+    "logic": (["logic"], 200, ("pandas", "matplotlib")),
+    "database": (["database"], 30, ("pandas", "matplotlib", "numpy")),
+    "ranking": (["ranking"], 200, ("pandas", "matplotlib")),
+    "app imports": (app_imports(), 1400, ("matplotlib",)),
+}
+
+def import_times(modules):
+    """
+    Returns [(depth, name, cumulative_us)] for one fresh interpreter.
+    """
+    code = "; ".join(f"import {m}" for m in modules) or "pass"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                          capture_output=True, text=True, check=True)
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative)))
+    return entries
+
+def measure(modules, startup):
+    """
+    Returns (ms, {top-level package: ms}, set of all imported module names).
+    """
+    entries = import_times(modules)
+    top = {name: us / 1000.0 for depth, name, us in entries if depth == 0 and name not in startup}
+    return sum(top.values()), top, {name for _, name, _ in entries}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N fresh interpreters")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget")
+    parser.add_argument("--top", type=int, default=5, help="heaviest top-level imports to list")
+    args = parser.parse_args()
+
+    # Modules the interpreter imports before any user code (site, encodings, ...)
+    startup = {name for depth, name, _ in import_times([]) if depth == 0}
+
+    failures = []
+    print(f"{'target':14s} {'best ms':>9s} {'budget ms':>10s}  heaviest imports")
+    for label, (modules, budget, forbidden) in TARGETS.items():
+        runs = [measure(modules, startup) for _ in range(args.repeat)]
+        ms, top, loaded = min(runs, key=lambda r: r[0])
+        budget *= args.scale
+        heaviest = ", ".join(f"{name} {t:.0f}" for name, t in sorted(top.items(), key=lambda kv: -kv[1])[:args.top])
+        print(f"{label:14s} {ms:9.1f} {budget:10.0f}  {heaviest}")
+        if ms > budget:
+            failures.append(f"{label}: {ms:.1f} ms exceeds the {budget:.0f} ms budget")
+        for mod in forbidden:
+            if mod in loaded:
+                failures.append(f"{label}: imports {mod} at import time")
+
+    for f in failures:
+        print("REGRESSION:", f)
+    print("OK" if not failures else f"FAILED ({len(failures)})")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,219 @@
 
 import sqlite3
-import pandas as pd
 import datetime
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
 
 DB_PATH = 'pachinko.db'
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+# Connection settings (applied once per pooled connection)
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16384
+POOL_SIZE = 8
+
+# Retries for SQLITE_BUSY that the busy handler does not absorb (e.g. a
+# WAL snapshot that went stale before BEGIN IMMEDIATE), with jittered backoff
+BUSY_RETRIES = 5
+BUSY_BACKOFF_S = 0.02
+BUSY_BACKOFF_MAX_S = 1.0
+busy_retry_count = 0    # retries taken in this process (for diagnostics)
+
+_pool_lock = threading.Lock()
+_pools = {}             # (pid, db_path) -> idle connections
+_local = threading.local()
+
+# (pid, db_path, store_id) -> {machine_number: machine_id}, committed machines only
+_machine_ids = {}
+_machine_ids_generation = 0
+
+# (pid, db_path, store_id) -> configuration index (see get_store_index), committed config only
+_store_index = {}
+_store_index_generation = 0
+
+# Data versions for read caches: (db_path, store_id or None) -> counter, bumped
+# after every committed write. Kept across importlib.reload(database) (app.py
+# in dev mode), so versions never repeat within a process.
+_data_versions = globals().get('_data_versions', {})
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+@contextmanager
+def connection():
+    """
+    Yields a pooled connection (autocommit mode; use transaction() for writes).
+    Nested use on the same thread reuses the connection already checked out,
+    so helpers called inside a transaction see its uncommitted rows.
+    """
+    held = getattr(_local, 'conn', None)
+    if held is not None and _local.path == DB_PATH:
+        yield held
+        return
+
+    key = (os.getpid(), DB_PATH)
+    with _pool_lock:
+        idle = _pools.setdefault(key, [])
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = _connect(DB_PATH)
+
+    _local.conn, _local.path = conn, DB_PATH
+    try:
+        yield conn
+    finally:
+        _local.conn = _local.path = None
+        if conn.in_transaction:
+            conn.rollback()
+        with _pool_lock:
+            idle = _pools.setdefault(key, [])
+            if len(idle) < POOL_SIZE:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+@contextmanager
+def transaction():
+    """
+    Runs the block in one write transaction (BEGIN IMMEDIATE) and yields a cursor.
+    Nested transaction() blocks become SAVEPOINTs of the outer one.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        if conn.in_transaction:
+            depth = getattr(_local, 'savepoints', 0) + 1
+            _local.savepoints = depth
+            name = f"sp_{depth}"
+            c.execute(f"SAVEPOINT {name}")
+            try:
+                yield c
+            except BaseException:
+                c.execute(f"ROLLBACK TO {name}")
+                c.execute(f"RELEASE {name}")
+                raise
+            else:
+                c.execute(f"RELEASE {name}")
+            finally:
+                _local.savepoints = depth - 1
+            return
+
+        c.execute("BEGIN IMMEDIATE")
+        _local.changed = set()
+        _local.stale = set()    # (cache invalidator, store_id) to run again after commit
+        try:
+            yield c
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+            stale, _local.stale = _local.stale, None
+            for store_id in _local.changed:
+                _bump(store_id)
+            for invalidate, store_id in stale:
+                invalidate(store_id)
+        finally:
+            _local.changed = None
+            _local.stale = None
+
+def _invalidate_after_commit(invalidate, store_id):
+    # Until the outer transaction commits, other threads still read (and may
+    # cache) the old state; drop their entries again once it is visible
+    stale = getattr(_local, 'stale', None)
+    if stale is not None:
+        stale.add((invalidate, store_id))
+
+def _bump(store_id):
+    key = (DB_PATH, store_id)
+    with _pool_lock:
+        _data_versions[key] = _data_versions.get(key, 0) + 1
+
+def bump_data_version(store_id=None):
+    """
+    Marks data of one store (None: all stores / the store list) as changed.
+    Inside a transaction the bump is deferred until it commits, so a cache
+    never stores pre-commit data under the new version.
+    """
+    changed = getattr(_local, 'changed', None)
+    if changed is not None:
+        changed.add(store_id)
+    else:
+        _bump(store_id)
+
+def data_version(store_id=None):
+    """
+    Cache key component: changes whenever data of store_id (or any store) changes.
+    """
+    return (_data_versions.get((DB_PATH, None), 0),
+            _data_versions.get((DB_PATH, store_id), 0) if store_id is not None else 0)
+
+def close_connections():
+    """
+    Closes all idle pooled connections (e.g. before deleting the DB file).
+    """
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for idle in pools:
+        for conn in idle:
+            conn.close()
+
+def is_busy_error(exc):
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+def retry_on_busy(func):
+    """
+    Re-runs a write function when SQLite reports busy/locked, with
+    exponential backoff and jitter, up to BUSY_RETRIES times.
+    Calls made inside an open transaction are not retried here; the
+    outermost caller owns the transaction and retries it as a whole.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global busy_retry_count
+        attempt = 0
+        while True:
+            held = getattr(_local, 'conn', None)
+            if held is not None and held.in_transaction:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt >= BUSY_RETRIES:
+                    raise
+            delay = min(BUSY_BACKOFF_MAX_S, BUSY_BACKOFF_S * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+            busy_retry_count += 1
+    return wrapper
+
+def _column_exists(c, table, column):
+    c.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in c.fetchall())
+
+def _add_column(c, table, column, decl):
+    """
+    ALTER TABLE ... ADD COLUMN unless it exists. Returns True if added.
+    """
+    if _column_exists(c, table, column):
+        return False
+    c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+def _migration_1_base_tables(c):
     # Stores: name, exchange_rate
     c.execute('''CREATE TABLE IF NOT EXISTS stores (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,27 +248,11 @@ def init_db():
         FOREIGN KEY(machine_id) REFERENCES machines(id)
     )''')
     
-    # Migration: Ensure new columns exist if table already exists
-    try:
-        c.execute("ALTER TABLE machines ADD COLUMN avg_base REAL DEFAULT 20.0")
-    except sqlite3.OperationalError:
-        pass # Column likely exists
-    
-    try:
-        c.execute("ALTER TABLE records ADD COLUMN base_calculated REAL")
-    except sqlite3.OperationalError:
-        pass
-        
-    try:
-        c.execute("ALTER TABLE records ADD COLUMN out_10r_calculated REAL")
-    except sqlite3.OperationalError:
-        pass
-        
-    try:
-        c.execute("ALTER TABLE machines ADD COLUMN remarks TEXT DEFAULT ''")
-    except sqlite3.OperationalError:
-        pass
-    
+    # Columns added after the first release (databases created before them)
+    _add_column(c, "machines", "avg_base", "REAL DEFAULT 20.0")
+    _add_column(c, "records", "base_calculated", "REAL")
+    _add_column(c, "records", "out_10r_calculated", "REAL")
+    _add_column(c, "machines", "remarks", "TEXT DEFAULT ''")
     
     # Deleted Records: for undo functionality
     c.execute('''CREATE TABLE IF NOT EXISTS deleted_records (
@@ -79,53 +268,243 @@ def init_db():
         out_10r_calculated REAL,
         deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
-    
-    conn.commit()
-    conn.close()
+
+def _migration_2_running_totals(c):
+    # Running totals (maintained by delta on every record write)
+    added = False
+    added |= _add_column(c, "machines", "total_hits", "INTEGER DEFAULT 0")
+    added |= _add_column(c, "machines", "total_investment_balls", "INTEGER DEFAULT 0")
+    added |= _add_column(c, "machines", "record_count", "INTEGER DEFAULT 0")
+    if added:
+        # Existing database: backfill the new columns from records once
+        c.execute("SELECT id FROM machines")
+        for (mid,) in c.fetchall():
+            _store_machine_totals(c, mid, *_sum_records(c, mid))
+
+def _migration_3_machine_indexes(c):
+    # WHERE machine_id=? ORDER BY id DESC: the index is ordered by (machine_id, rowid)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_records_machine ON records(machine_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deleted_records_machine ON deleted_records(machine_id)")
+
+def _migration_4_model_groups(c):
+    # Model groups (islands): membership by machine number, running totals = sum of members
+    c.execute('''CREATE TABLE IF NOT EXISTS model_groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        store_id INTEGER,
+        name TEXT,
+        total_spins INTEGER DEFAULT 0,
+        total_investment_balls INTEGER DEFAULT 0,
+        total_hits INTEGER DEFAULT 0,
+        total_out_balls INTEGER DEFAULT 0,
+        record_count INTEGER DEFAULT 0,
+        FOREIGN KEY(store_id) REFERENCES stores(id),
+        UNIQUE(store_id, name)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS model_group_members (
+        group_id INTEGER,
+        store_id INTEGER,
+        machine_number INTEGER,
+        FOREIGN KEY(group_id) REFERENCES model_groups(id),
+        PRIMARY KEY(group_id, machine_number)
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_model_group_members_machine ON model_group_members(store_id, machine_number)")
+
+def _migration_5_daily_rollup(c):
+    # Per-(machine, day) totals for windowed stats, backfilled from records
+    c.execute('''CREATE TABLE IF NOT EXISTS machine_daily (
+        machine_id INTEGER,
+        date TEXT,
+        spins INTEGER DEFAULT 0,
+        investment_balls INTEGER DEFAULT 0,
+        hits INTEGER DEFAULT 0,
+        out_balls INTEGER DEFAULT 0,
+        record_count INTEGER DEFAULT 0,
+        PRIMARY KEY(machine_id, date)
+    ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_records_machine_date ON records(machine_id, date)")
+    c.execute("DELETE FROM machine_daily")
+    c.execute('''INSERT INTO machine_daily (machine_id, date, spins, investment_balls, hits, out_balls, record_count)
+                 SELECT machine_id, COALESCE(date, ''), SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id)
+                 FROM records GROUP BY machine_id, COALESCE(date, '')''')
+
+def _migration_6_store_settings(c):
+    # Per-store calculator settings; a row marks the store as configured (store_config.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS store_settings (
+        store_id INTEGER PRIMARY KEY,
+        calc_group TEXT,
+        calc_model TEXT,
+        default_rate REAL,
+        default_out INTEGER DEFAULT 1400,
+        FOREIGN KEY(store_id) REFERENCES stores(id)
+    )''')
+
+# Ordered, run-once schema migrations: (version, function)
+MIGRATIONS = [
+    (1, _migration_1_base_tables),
+    (2, _migration_2_running_totals),
+    (3, _migration_3_machine_indexes),
+    (4, _migration_4_model_groups),
+    (5, _migration_5_daily_rollup),
+    (6, _migration_6_store_settings),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_ready = set()   # (pid, db_path) already migrated in this process
+
+def get_schema_version():
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'")
+        if not c.fetchone():
+            return 0
+        c.execute("SELECT MAX(version) FROM schema_version")
+        return c.fetchone()[0] or 0
+
+@retry_on_busy
+def migrate(target_version=None):
+    """
+    Applies pending migrations up to target_version (default: latest),
+    each in its own transaction together with its schema_version row.
+    """
+    target = SCHEMA_VERSION if target_version is None else target_version
+    with transaction() as c:
+        c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+    current = get_schema_version()
+    for version, func in MIGRATIONS:
+        if not current < version <= target:
+            continue
+        with transaction() as c:
+            # Re-check under the write lock: a concurrent process may have applied it meanwhile
+            c.execute("SELECT MAX(version) FROM schema_version")
+            current = c.fetchone()[0] or 0
+            if current >= version:
+                continue
+            func(c)
+            bump_data_version()
+            c.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            current = version
+    return max(current, min(target, SCHEMA_VERSION))
+
+def init_db():
+    """
+    Brings the schema up to date. After the first call per process and
+    database this is a no-op that issues no SQL.
+    """
+    key = (os.getpid(), DB_PATH)
+    if key in _schema_ready:
+        return
+    if get_schema_version() < SCHEMA_VERSION:
+        migrate()
+    _schema_ready.add(key)
 
 def get_stores():
-    conn = sqlite3.connect(DB_PATH)
+    # pandas only for the two DataFrame readers, so importing this module stays cheap
+    import pandas as pd
     try:
-        df = pd.read_sql_query("SELECT * FROM stores", conn)
+        with connection() as conn:
+            return pd.read_sql_query("SELECT * FROM stores", conn)
     except:
         return pd.DataFrame()
-    conn.close()
-    return df
 
+@retry_on_busy
 def add_store(name, rate):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """
+    Returns True if the store was added, False if the name already exists.
+    """
     try:
-        c.execute("INSERT INTO stores (name, exchange_rate) VALUES (?, ?)", (name, rate))
-        conn.commit()
+        with transaction() as c:
+            c.execute("INSERT INTO stores (name, exchange_rate) VALUES (?, ?)", (name, rate))
+            bump_data_version()
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
+
+def get_store_id(name):
+    with connection() as conn:
+        row = conn.execute("SELECT id FROM stores WHERE name=?", (name,)).fetchone()
+    return row[0] if row else None
+
+def invalidate_machine_ids(store_id=None):
+    """
+    Drops the cached machine ids of one store (or all stores).
+    Must be called after machines are deleted or renumbered.
+    """
+    global _machine_ids_generation
+    _invalidate_after_commit(invalidate_machine_ids, store_id)
+    with _pool_lock:
+        _machine_ids_generation += 1
+        if store_id is None:
+            _machine_ids.clear()
+        else:
+            for key in [k for k in _machine_ids if k[2] == store_id]:
+                del _machine_ids[key]
+
+def resolve_machine(store_id, machine_number):
+    """
+    Machine id for (store, number), or None if it does not exist. Never writes.
+    The first call per store loads all of its ids with one query; later hits
+    need no connection. Numbers missing from the map (created since) are
+    looked up individually. Ids seen only inside an open transaction are
+    not cached, since it may still roll back.
+    """
+    key = (os.getpid(), DB_PATH, store_id)
+    ids = _machine_ids.get(key)
+    if ids is not None and machine_number in ids:
+        return ids[machine_number]
+
+    with connection() as conn:
+        committed = not conn.in_transaction
+        c = conn.cursor()
+        if ids is None:
+            generation = _machine_ids_generation
+            c.execute("SELECT machine_number, id FROM machines WHERE store_id=?", (store_id,))
+            ids = dict(c.fetchall())
+            if committed:
+                with _pool_lock:
+                    if generation == _machine_ids_generation:
+                        _machine_ids[key] = ids
+            return ids.get(machine_number)
+
+        c.execute("SELECT id FROM machines WHERE store_id=? AND machine_number=?", (store_id, machine_number))
+        row = c.fetchone()
+    if row is None:
+        return None
+    if committed:
+        ids[machine_number] = row[0]
+    return row[0]
+
+@retry_on_busy
+def get_or_create_machine_id(store_id, machine_number):
+    """
+    Write-path resolution: creates the machine if it does not exist.
+    """
+    mid = resolve_machine(store_id, machine_number)
+    if mid is not None:
+        return mid
+    with transaction() as c:
+        # Re-check under the write lock: another session may have created it
+        c.execute("INSERT OR IGNORE INTO machines (store_id, machine_number) VALUES (?, ?)", (store_id, machine_number))
+        c.execute("SELECT id FROM machines WHERE store_id=? AND machine_number=?", (store_id, machine_number))
+        bump_data_version(store_id)
+        mid = c.fetchone()[0]
+    invalidate_store_index(store_id)
+    return mid
 
 def get_or_create_machine(store_id, machine_number):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, avg_out_balls FROM machines WHERE store_id=? AND machine_number=?", (store_id, machine_number))
-    res = c.fetchone()
-    if res:
-        conn.close()
-        return res[0], res[1]
-    else:
-        c.execute("INSERT INTO machines (store_id, machine_number) VALUES (?, ?)", (store_id, machine_number))
-        mid = c.lastrowid
-        conn.commit()
-        conn.close()
-        # Default 1400
-        return mid, 1400.0
+    mid = get_or_create_machine_id(store_id, machine_number)
+    with connection() as conn:
+        res = conn.execute("SELECT avg_out_balls FROM machines WHERE id=?", (mid,)).fetchone()
+    # Default 1400
+    return mid, res[0] if res and res[0] is not None else 1400.0
 
+@retry_on_busy
 def add_record(store_id, machine_number, investment, spins, hits, out_balls, date=None):
     if date is None:
         date = datetime.date.today().strftime('%Y-%m-%d')
     
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    
     # Calculate performance metrics for this specific record
     # Base = Spins / (Investment / 250)
     inv_units = investment / 250.0
@@ -134,44 +513,41 @@ def add_record(store_id, machine_number, investment, spins, hits, out_balls, dat
     # 10R Out = Out / Hits
     out_10r_cal = out_balls / hits if hits > 0 else 0.0
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO records (machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-              (mid, date, investment, spins, hits, out_balls, base_cal, out_10r_cal))
-    
-    # Update machine stats: Weighted Average
-    c.execute("SELECT SUM(hits), SUM(out_balls), SUM(spins), SUM(investment_balls) FROM records WHERE machine_id=?", (mid,))
-    row = c.fetchone()
-    if row:
-        t_hits = row[0] or 0
-        t_out = row[1] or 0
-        t_spins = row[2] or 0
-        t_inv = row[3] or 0
+    with transaction() as c:
+        mid = get_or_create_machine_id(store_id, machine_number)
+        c.execute("INSERT INTO records (machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                  (mid, date, investment, spins, hits, out_balls, base_cal, out_10r_cal))
         
-        # Weighted Avg Out
-        new_avg_out = t_out / t_hits if t_hits > 0 else 1400.0
-        
-        # Weighted Base
-        t_inv_units = t_inv / 250.0
-        new_avg_base = t_spins / t_inv_units if t_inv_units > 0 else 20.0
-        
-        # Update summary
-        c.execute("UPDATE machines SET avg_out_balls = ?, avg_base = ?, total_spins = ?, total_out_balls = ? WHERE id = ?", 
-                  (new_avg_out, new_avg_base, t_spins, t_out, mid))
-    
-    conn.commit()
-    conn.close()
+        # Update machine stats: running totals + weighted averages
+        _apply_record_delta(c, mid, 1, date, investment, spins, hits, out_balls)
+        bump_data_version(store_id)
 
-def get_machine_weighted_stats(store_id, machine_number):
+def window_start(days, today=None):
     """
-    Returns (weighted_base, weighted_avg_out, total_spins, total_hits, record_count)
+    First date ('YYYY-MM-DD') of the last `days` days including today.
     """
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id) FROM records WHERE machine_id=?", (mid,))
-    row = c.fetchone()
-    conn.close()
+    today = today or datetime.date.today()
+    return (today - datetime.timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+def get_machine_weighted_stats(store_id, machine_number, days=None):
+    """
+    Returns (weighted_base, weighted_avg_out, total_spins, total_inv_balls, total_out_balls, total_hits, record_count)
+    served from the machine's running totals, or from its daily rollup
+    over the last `days` days.
+    """
+    mid = resolve_machine(store_id, machine_number)
+    if mid is None:
+        return 0, 1400.0, 0, 0, 0, 0, 0
+    if days:
+        with connection() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), SUM(record_count)
+                         FROM machine_daily WHERE machine_id=? AND date>=?""", (mid, window_start(days)))
+            return _weighted_totals(c.fetchone())
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT total_spins, total_investment_balls, total_hits, total_out_balls, record_count FROM machines WHERE id=?", (mid,))
+        row = c.fetchone()
     
     if not row or not row[0]:
         return 0, 1400.0, 0, 0, 0, 0, 0
@@ -191,69 +567,52 @@ def get_machine_weighted_stats(store_id, machine_number):
     
     return weighted_base, weighted_out, t_spins, t_inv_balls, t_out_balls, t_hits, record_count
 
-    # Deleted Records: for undo functionality
-    c.execute('''CREATE TABLE IF NOT EXISTS deleted_records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        original_record_id INTEGER,
-        machine_id INTEGER,
-        date TEXT,
-        investment_balls INTEGER,
-        spins INTEGER,
-        hits INTEGER,
-        out_balls INTEGER,
-        base_calculated REAL,
-        out_10r_calculated REAL,
-        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    conn.commit()
-    conn.close()
-
-# ... (omitted parts) ...
-
+@retry_on_busy
 def delete_last_record(store_id, machine_number):
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Find the last record
-    c.execute("SELECT * FROM records WHERE machine_id=? ORDER BY id DESC LIMIT 1", (mid,))
-    row = c.fetchone()
-    
-    if row:
-        # row structure: 0:id, 1:mid, 2:date, 3:inv, 4:spins, 5:hits, 6:out, 7:base, 8:out10r
-        original_id = row[0]
+    mid = resolve_machine(store_id, machine_number)
+    if mid is None:
+        return
+    with transaction() as c:
         
-        # Backup to deleted_records
-        c.execute('''INSERT INTO deleted_records 
-                     (original_record_id, machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8]))
-        
-        # Delete from records
-        c.execute("DELETE FROM records WHERE id=?", (original_id,))
+        # Find the last record
+        c.execute("SELECT * FROM records WHERE machine_id=? ORDER BY id DESC LIMIT 1", (mid,))
+        row = c.fetchone()
         
-        # Recalculate stats
-        update_machine_stats(c, mid)
+        if row:
+            # row structure: 0:id, 1:mid, 2:date, 3:inv, 4:spins, 5:hits, 6:out, 7:base, 8:out10r
+            original_id = row[0]
             
-    conn.commit()
-    conn.close()
+            # Backup to deleted_records
+            c.execute('''INSERT INTO deleted_records 
+                         (original_record_id, machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8]))
+            
+            # Delete from records
+            c.execute("DELETE FROM records WHERE id=?", (original_id,))
+            
+            # Subtract from running totals
+            _apply_record_delta(c, mid, -1, row[2], row[3], row[4], row[5], row[6])
+            bump_data_version(store_id)
 
+@retry_on_busy
 def restore_last_record(store_id, machine_number):
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Find the last deleted record for this machine
-    c.execute("SELECT * FROM deleted_records WHERE machine_id=? ORDER BY id DESC LIMIT 1", (mid,))
-    row = c.fetchone()
-    
-    if row:
+    mid = resolve_machine(store_id, machine_number)
+    if mid is None:
+        return False
+    with transaction() as c:
+        
+        # Find the last deleted record for this machine
+        c.execute("SELECT * FROM deleted_records WHERE machine_id=? ORDER BY id DESC LIMIT 1", (mid,))
+        row = c.fetchone()
+        
+        if not row:
+            return False
+        
         # row structure based on CREATE TABLE: 
         # 0:id, 1:orig_id, 2:mid, 3:date, 4:inv, 5:spins, 6:hits, 7:out, 8:base, 9:out10r, 10:deleted_at
         del_rec_id = row[0]
         
-        # Restore to records (Letting ID auto-increment to be new, or we could force original ID but that might conflict. New ID is safer)
         # Restore to records (Letting ID auto-increment to be new)
         c.execute('''INSERT INTO records 
                      (machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated)
@@ -263,153 +622,435 @@ def restore_last_record(store_id, machine_number):
         # Remove from deleted_records
         c.execute("DELETE FROM deleted_records WHERE id=?", (del_rec_id,))
         
-        # Recalculate stats
-        update_machine_stats(c, mid)
-        
-        conn.commit()
-        conn.close()
-        return True
+        # Add back to running totals
+        _apply_record_delta(c, row[2], 1, row[3], row[4], row[5], row[6], row[7])
+        bump_data_version(store_id)
+    return True
+
+def _store_machine_totals(c, mid, t_spins, t_inv, t_hits, t_out, count):
+    # Weighted Avg Out
+    new_avg_out = t_out / t_hits if t_hits > 0 else 1400.0
     
-    conn.close()
-    return False
+    # Weighted Base
+    t_inv_units = t_inv / 250.0
+    new_avg_base = t_spins / t_inv_units if t_inv_units > 0 else 20.0
+    
+    c.execute("""UPDATE machines SET avg_out_balls = ?, avg_base = ?, total_spins = ?, total_investment_balls = ?,
+                 total_hits = ?, total_out_balls = ?, record_count = ? WHERE id = ?""",
+              (new_avg_out, new_avg_base, t_spins, t_inv, t_hits, t_out, count, mid))
+
+def _write_machine_totals(c, mid, t_spins, t_inv, t_hits, t_out, count, old=None):
+    """
+    Writes a machine's running totals and moves the difference to every
+    model group containing it (same transaction).
+    old: the machine's previous totals if the caller has already read them.
+    """
+    if old is None:
+        c.execute("SELECT total_spins, total_investment_balls, total_hits, total_out_balls, record_count FROM machines WHERE id=?", (mid,))
+        row = c.fetchone()
+        old = [v or 0 for v in row] if row else [0, 0, 0, 0, 0]
+    _store_machine_totals(c, mid, t_spins, t_inv, t_hits, t_out, count)
+    delta = (t_spins - old[0], t_inv - old[1], t_hits - old[2], t_out - old[3], count - old[4])
+    if any(delta):
+        c.execute("""UPDATE model_groups SET total_spins = total_spins + ?, total_investment_balls = total_investment_balls + ?,
+                     total_hits = total_hits + ?, total_out_balls = total_out_balls + ?, record_count = record_count + ?
+                     WHERE id IN (SELECT g.group_id FROM model_group_members g
+                                  JOIN machines m ON m.store_id = g.store_id AND m.machine_number = g.machine_number
+                                  WHERE m.id = ?)""",
+                  delta + (mid,))
+
+def _apply_record_delta(c, mid, sign, date, investment, spins, hits, out_balls):
+    """
+    Adds (sign=1) or removes (sign=-1) one record from the machine's running totals
+    and its day in machine_daily.
+    Must run in the same transaction as the records insert/delete.
+    """
+    _apply_daily_delta(c, mid, date, sign, investment, spins, hits, out_balls)
+    c.execute("SELECT total_spins, total_investment_balls, total_hits, total_out_balls, record_count FROM machines WHERE id=?", (mid,))
+    row = c.fetchone()
+    if not row:
+        return
+    old = [v or 0 for v in row]
+    t_spins, t_inv, t_hits, t_out, count = old
+    _write_machine_totals(c, mid,
+                          t_spins + sign * (spins or 0),
+                          t_inv + sign * (investment or 0),
+                          t_hits + sign * (hits or 0),
+                          t_out + sign * (out_balls or 0),
+                          count + sign,
+                          old=old)
+
+def _apply_daily_delta(c, mid, date, sign, investment, spins, hits, out_balls):
+    date = date or ''
+    c.execute("""INSERT INTO machine_daily (machine_id, date, spins, investment_balls, hits, out_balls, record_count)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                 ON CONFLICT(machine_id, date) DO UPDATE SET
+                     spins = spins + excluded.spins,
+                     investment_balls = investment_balls + excluded.investment_balls,
+                     hits = hits + excluded.hits,
+                     out_balls = out_balls + excluded.out_balls,
+                     record_count = record_count + excluded.record_count""",
+              (mid, date, sign * (spins or 0), sign * (investment or 0), sign * (hits or 0), sign * (out_balls or 0), sign))
+    if sign < 0:
+        c.execute("DELETE FROM machine_daily WHERE machine_id=? AND date=? AND record_count <= 0", (mid, date))
+
+def _rebuild_daily(c, mid):
+    c.execute("DELETE FROM machine_daily WHERE machine_id=?", (mid,))
+    c.execute("""INSERT INTO machine_daily (machine_id, date, spins, investment_balls, hits, out_balls, record_count)
+                 SELECT machine_id, COALESCE(date, ''), SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id)
+                 FROM records WHERE machine_id=? GROUP BY COALESCE(date, '')""", (mid,))
+
+def _sum_records(c, mid):
+    c.execute("SELECT SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id) FROM records WHERE machine_id=?", (mid,))
+    return tuple(v or 0 for v in c.fetchone())
 
 def update_machine_stats(c, mid):
-    c.execute("SELECT SUM(hits), SUM(out_balls), SUM(spins), SUM(investment_balls) FROM records WHERE machine_id=?", (mid,))
-    stat_row = c.fetchone()
-    
-    if stat_row and stat_row[2]: # If there are still records
-        t_hits = stat_row[0] or 0
-        t_out = stat_row[1] or 0
-        t_spins = stat_row[2] or 0
-        t_inv = stat_row[3] or 0
-        
-        # Weighted Avg Out
-        new_avg_out = t_out / t_hits if t_hits > 0 else 1400.0
-        
-        # Weighted Base
-        t_inv_units = t_inv / 250.0
-        new_avg_base = t_spins / t_inv_units if t_inv_units > 0 else 20.0
-        
-        c.execute("UPDATE machines SET avg_out_balls = ?, avg_base = ?, total_spins = ?, total_out_balls = ? WHERE id = ?", 
-                  (new_avg_out, new_avg_base, t_spins, t_out, mid))
-    else:
-        # No records left, reset to default
-        c.execute("UPDATE machines SET avg_out_balls=1400.0, avg_base=20.0, total_spins=0, total_out_balls=0 WHERE id=?", (mid,))
+    """
+    Rebuilds one machine's running totals and daily rollup from its records (full rescan).
+    """
+    _write_machine_totals(c, mid, *_sum_records(c, mid))
+    _rebuild_daily(c, mid)
+
+@retry_on_busy
+def verify_machine_aggregates(fix=False):
+    """
+    Compares every machine's running totals with a rescan of its records.
+    Returns [(machine_id, stored_totals, actual_totals)] for drifted machines;
+    with fix=True those machines are rebuilt in the same transaction.
+    """
+    drift = []
+    with transaction() as c:
+        c.execute("SELECT id, total_spins, total_investment_balls, total_hits, total_out_balls, record_count FROM machines")
+        for row in c.fetchall():
+            mid = row[0]
+            stored = tuple(v or 0 for v in row[1:])
+            actual = _sum_records(c, mid)
+            if stored != actual:
+                drift.append((mid, stored, actual))
+                if fix:
+                    _write_machine_totals(c, mid, *actual, old=stored)
+        if fix and drift:
+            bump_data_version()
+    return drift
+
+@retry_on_busy
+def verify_daily_rollups(fix=False):
+    """
+    Compares machine_daily with a GROUP BY over records.
+    Returns the ids of machines whose rollup differs; fix=True rebuilds them.
+    """
+    with transaction() as c:
+        c.execute("""SELECT machine_id, COALESCE(date, ''), SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id)
+                     FROM records GROUP BY machine_id, COALESCE(date, '')""")
+        actual = set(c.fetchall())
+        c.execute("SELECT machine_id, date, spins, investment_balls, hits, out_balls, record_count FROM machine_daily")
+        stored = set(c.fetchall())
+        drifted = sorted({row[0] for row in actual ^ stored})
+        if fix:
+            for mid in drifted:
+                _rebuild_daily(c, mid)
+            if drifted:
+                bump_data_version()
+    return drifted
 
+def _sum_group_members(c, group_id):
+    c.execute("""SELECT SUM(m.total_spins), SUM(m.total_investment_balls), SUM(m.total_hits), SUM(m.total_out_balls), SUM(m.record_count)
+                 FROM model_group_members g
+                 JOIN machines m ON m.store_id = g.store_id AND m.machine_number = g.machine_number
+                 WHERE g.group_id=?""", (group_id,))
+    return tuple(v or 0 for v in c.fetchone())
+
+def _recompute_groups(c, group_ids):
+    """
+    Rebuilds the running totals of the given model groups from their members.
+    """
+    for gid in group_ids:
+        c.execute("""UPDATE model_groups SET total_spins = ?, total_investment_balls = ?, total_hits = ?,
+                     total_out_balls = ?, record_count = ? WHERE id = ?""",
+                  _sum_group_members(c, gid) + (gid,))
+
+def _groups_of_machines(c, store_id, machine_numbers):
+    if not machine_numbers:
+        return []
+    numbers = list(machine_numbers)
+    placeholders = ','.join(['?'] * len(numbers))
+    c.execute(f"SELECT DISTINCT group_id FROM model_group_members WHERE store_id=? AND machine_number IN ({placeholders})",
+              [store_id] + numbers)
+    return [r[0] for r in c.fetchall()]
+
+@retry_on_busy
+def verify_group_aggregates(fix=False):
+    """
+    Same check as verify_machine_aggregates for the model group totals
+    (against the sum of their members' running totals).
+    Returns [(group_id, stored_totals, actual_totals)].
+    """
+    drift = []
+    with transaction() as c:
+        c.execute("SELECT id, total_spins, total_investment_balls, total_hits, total_out_balls, record_count FROM model_groups")
+        for row in c.fetchall():
+            stored = tuple(v or 0 for v in row[1:])
+            actual = _sum_group_members(c, row[0])
+            if stored != actual:
+                drift.append((row[0], stored, actual))
+        if fix and drift:
+            _recompute_groups(c, [gid for gid, _, _ in drift])
+            bump_data_version()
+    return drift
+
+def _read_model_groups(c, store_id):
+    c.execute("""SELECT g.name, m.machine_number FROM model_groups g
+                 LEFT JOIN model_group_members m ON m.group_id = g.id
+                 WHERE g.store_id=?""", (store_id,))
+    groups = {}
+    for name, num in c.fetchall():
+        members = groups.setdefault(name, set())
+        if num is not None:
+            members.add(num)
+    return groups
+
+@retry_on_busy
+def set_model_groups(store_id, model_groups):
+    """
+    Stores the store's model groups ({group_name: [machine_number, ...]}).
+    Unchanged configuration costs one read; otherwise only the groups whose
+    membership changed are rebuilt. Returns the names of the changed groups.
+    """
+    target = {name: set(nums) for name, nums in model_groups.items()}
+    with connection() as conn:
+        if _read_model_groups(conn.cursor(), store_id) == target:
+            return []
+
+    changed = []
+    with transaction() as c:
+        current = _read_model_groups(c, store_id)
+        for name in current.keys() - target.keys():
+            c.execute("DELETE FROM model_group_members WHERE group_id IN (SELECT id FROM model_groups WHERE store_id=? AND name=?)", (store_id, name))
+            c.execute("DELETE FROM model_groups WHERE store_id=? AND name=?", (store_id, name))
+            changed.append(name)
+
+        rebuild = []
+        for name, nums in target.items():
+            if current.get(name) == nums:
+                continue
+            c.execute("INSERT OR IGNORE INTO model_groups (store_id, name) VALUES (?, ?)", (store_id, name))
+            c.execute("SELECT id FROM model_groups WHERE store_id=? AND name=?", (store_id, name))
+            gid = c.fetchone()[0]
+            c.execute("DELETE FROM model_group_members WHERE group_id=?", (gid,))
+            c.executemany("INSERT INTO model_group_members (group_id, store_id, machine_number) VALUES (?, ?, ?)",
+                          [(gid, store_id, num) for num in sorted(nums)])
+            rebuild.append(gid)
+            changed.append(name)
+        _recompute_groups(c, rebuild)
+        if changed:
+            bump_data_version(store_id)
+    if changed:
+        invalidate_store_index(store_id)
+    return changed
+
+@retry_on_busy
+def set_store_settings(store_id, calc_group, calc_model, default_rate=None, default_out=1400):
+    """
+    Calculator settings of a store: the island whose averages it uses, the
+    models.json model it evaluates, default exchange rate (None: the store's
+    rate) and default average out.
+    """
+    with transaction() as c:
+        c.execute('''INSERT INTO store_settings (store_id, calc_group, calc_model, default_rate, default_out)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(store_id) DO UPDATE SET calc_group=excluded.calc_group, calc_model=excluded.calc_model,
+                         default_rate=excluded.default_rate, default_out=excluded.default_out''',
+                  (store_id, calc_group, calc_model, default_rate, default_out))
+        bump_data_version(store_id)
+    invalidate_store_index(store_id)
+
+def invalidate_store_index(store_id=None):
+    """
+    Drops the cached configuration index of one store (or all stores).
+    Called after machines, islands or calculator settings change.
+    """
+    global _store_index_generation
+    _invalidate_after_commit(invalidate_store_index, store_id)
+    with _pool_lock:
+        _store_index_generation += 1
+        if store_id is None:
+            _store_index.clear()
+        else:
+            for key in [k for k in _store_index if k[2] == store_id]:
+                del _store_index[key]
+
+def get_store_index(store_id):
+    """
+    Lookup tables for a store's configuration (treat as read-only):
+      machines:    sorted machine numbers
+      model_of:    {machine_number: island name}
+      groups:      {island name: (machine_number, ...)} in configuration order
+      machine_ids: {island name: (machine_id, ...)} of the members that exist
+      settings:    calculator settings dict, or None if the store is not configured
+    Built with three queries on first use per store, then served from memory
+    until a configuration write in this process invalidates it.
+    """
+    key = (os.getpid(), DB_PATH, store_id)
+    index = _store_index.get(key)
+    if index is not None:
+        return index
+
+    with connection() as conn:
+        committed = not conn.in_transaction
+        generation = _store_index_generation
+        c = conn.cursor()
+        c.execute("SELECT machine_number, id FROM machines WHERE store_id=? ORDER BY machine_number", (store_id,))
+        ids = dict(c.fetchall())
+        c.execute("""SELECT g.name, m.machine_number FROM model_groups g
+                     JOIN model_group_members m ON m.group_id = g.id
+                     WHERE g.store_id=? ORDER BY g.id, m.machine_number""", (store_id,))
+        members = {}
+        for name, num in c.fetchall():
+            members.setdefault(name, []).append(num)
+        c.execute("SELECT calc_group, calc_model, default_rate, default_out FROM store_settings WHERE store_id=?", (store_id,))
+        row = c.fetchone()
+
+    model_of = {}
+    for name, nums in members.items():
+        for num in nums:
+            model_of.setdefault(num, name)
+    index = {
+        "machines": tuple(ids),
+        "model_of": model_of,
+        "groups": {name: tuple(nums) for name, nums in members.items()},
+        "machine_ids": {name: tuple(ids[num] for num in nums if num in ids) for name, nums in members.items()},
+        "settings": dict(zip(("calc_group", "calc_model", "default_rate", "default_out"), row)) if row else None,
+    }
+    if committed:
+        with _pool_lock:
+            if generation == _store_index_generation:
+                _store_index[key] = index
+    return index
+
+@retry_on_busy
 def clear_machine_records(store_id, machine_number):
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM records WHERE machine_id=?", (mid,))
-    # Reset machine stats
-    c.execute("UPDATE machines SET avg_out_balls=1400.0, avg_base=20.0, total_spins=0, total_out_balls=0 WHERE id=?", (mid,))
-    conn.commit()
-    conn.close()
+    mid = resolve_machine(store_id, machine_number)
+    if mid is None:
+        return
+    with transaction() as c:
+        c.execute("DELETE FROM records WHERE machine_id=?", (mid,))
+        c.execute("DELETE FROM machine_daily WHERE machine_id=?", (mid,))
+        # Reset machine stats
+        _write_machine_totals(c, mid, 0, 0, 0, 0, 0)
+        bump_data_version(store_id)
 
 def get_all_machine_numbers(store_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT machine_number FROM machines WHERE store_id=? ORDER BY machine_number ASC", (store_id,))
-    rows = c.fetchall()
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT machine_number FROM machines WHERE store_id=? ORDER BY machine_number ASC", (store_id,))
+        rows = c.fetchall()
     return [r[0] for r in rows]
 
+@retry_on_busy
 def ensure_default_machines(store_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # 1. Cleanup
-    c.execute("SELECT id FROM machines WHERE store_id=? AND (machine_number < 987 OR machine_number > 1004)", (store_id,))
-    rows = c.fetchall()
-    ids_to_remove = [r[0] for r in rows]
-    
-    if ids_to_remove:
-        c.executemany("DELETE FROM records WHERE machine_id=?", [(mid,) for mid in ids_to_remove])
-        c.executemany("DELETE FROM machines WHERE id=?", [(mid,) for mid in ids_to_remove])
-    
-    # 2. Defaults 987-1004
-    defaults = range(987, 1005)
-    for num in defaults:
-        c.execute("INSERT OR IGNORE INTO machines (store_id, machine_number, avg_out_balls, avg_base, total_spins, total_out_balls) VALUES (?, ?, 1400.0, 20.0, 0, 0)", (store_id, num))
+    with transaction() as c:
+        # 1. Cleanup
+        c.execute("SELECT id FROM machines WHERE store_id=? AND (machine_number < 987 OR machine_number > 1004)", (store_id,))
+        rows = c.fetchall()
+        ids_to_remove = [r[0] for r in rows]
         
-    conn.commit()
-    conn.close()
+        if ids_to_remove:
+            c.execute(f"SELECT machine_number FROM machines WHERE id IN ({','.join(['?'] * len(ids_to_remove))})", ids_to_remove)
+            removed_numbers = [r[0] for r in c.fetchall()]
+            c.executemany("DELETE FROM records WHERE machine_id=?", [(mid,) for mid in ids_to_remove])
+            c.executemany("DELETE FROM machine_daily WHERE machine_id=?", [(mid,) for mid in ids_to_remove])
+            c.executemany("DELETE FROM machines WHERE id=?", [(mid,) for mid in ids_to_remove])
+            # Islands that lost machines
+            _recompute_groups(c, _groups_of_machines(c, store_id, removed_numbers))
+        
+        # 2. Defaults 987-1004
+        defaults = range(987, 1005)
+        c.executemany("INSERT OR IGNORE INTO machines (store_id, machine_number, avg_out_balls, avg_base, total_spins, total_out_balls) VALUES (?, ?, 1400.0, 20.0, 0, 0)",
+                      [(store_id, num) for num in defaults])
+        bump_data_version(store_id)
+    invalidate_machine_ids(store_id)
+    invalidate_store_index(store_id)
 
+@retry_on_busy
 def update_machine_remarks(store_id, machine_number, remarks):
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE machines SET remarks=? WHERE id=?", (remarks, mid))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        mid = get_or_create_machine_id(store_id, machine_number)
+        c.execute("UPDATE machines SET remarks=? WHERE id=?", (remarks, mid))
+        bump_data_version(store_id)
 
 def get_machine_remarks(store_id, machine_number):
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT remarks FROM machines WHERE id=?", (mid,))
-    row = c.fetchone()
-    conn.close()
+    mid = resolve_machine(store_id, machine_number)
+    if mid is None:
+        return ""
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT remarks FROM machines WHERE id=?", (mid,))
+        row = c.fetchone()
     return row[0] if row else ""
 
+@retry_on_busy
 def rename_store(old_name, new_name):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """
+    Returns True if a store was renamed; False if old_name does not exist
+    or new_name is already taken (same convention as add_store).
+    """
     try:
-        c.execute("UPDATE stores SET name=? WHERE name=?", (new_name, old_name))
-        conn.commit()
+        with transaction() as c:
+            c.execute("UPDATE stores SET name=? WHERE name=?", (new_name, old_name))
+            if c.rowcount == 0:
+                return False
+            bump_data_version()
+            return True
     except sqlite3.IntegrityError:
-        pass # Name might already exist
-    conn.close()
+        return False # Name already exists
 
+@retry_on_busy
 def ensure_machines(store_id, machine_numbers):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # 1. Identify machines to remove (those in DB but not in provided list)
-    # Get current machines for this store
-    c.execute("SELECT id, machine_number FROM machines WHERE store_id=?", (store_id,))
-    rows = c.fetchall()
-    current_map = {r[1]: r[0] for r in rows}
-    
-    target_set = set(machine_numbers)
-    current_set = set(current_map.keys())
-    
-    to_remove = current_set - target_set
-    to_add = target_set - current_set
-    
-    # Remove
-    for m_num in to_remove:
-        mid = current_map[m_num]
-        c.execute("DELETE FROM records WHERE machine_id=?", (mid,))
-        c.execute("DELETE FROM machines WHERE id=?", (mid,))
+    with transaction() as c:
+        # 1. Identify machines to remove (those in DB but not in provided list)
+        # Get current machines for this store
+        c.execute("SELECT id, machine_number FROM machines WHERE store_id=?", (store_id,))
+        rows = c.fetchall()
+        current_map = {r[1]: r[0] for r in rows}
         
-    # Add
-    for m_num in to_add:
-         c.execute("INSERT OR IGNORE INTO machines (store_id, machine_number, avg_out_balls, avg_base, total_spins, total_out_balls) VALUES (?, ?, 1400.0, 20.0, 0, 0)", (store_id, m_num))
+        target_set = set(machine_numbers)
+        current_set = set(current_map.keys())
         
-    conn.commit()
-    conn.close()
-
-def get_all_machines_status(store_id):
-    m_nums = get_all_machine_numbers(store_id)
-    data = []
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    for m in m_nums:
-        # returns 7 values
-        wb, wo, t_spins, t_inv, t_out, t_hits, _ = get_machine_weighted_stats(store_id, m)
-        mid, _ = get_or_create_machine(store_id, m)
+        to_remove = current_set - target_set
+        to_add = target_set - current_set
         
-        c.execute("SELECT remarks FROM machines WHERE id=?", (mid,))
-        res = c.fetchone()
-        remarks = res[0] if res else ""
+        # Remove
+        for m_num in to_remove:
+            mid = current_map[m_num]
+            c.execute("DELETE FROM records WHERE machine_id=?", (mid,))
+            c.execute("DELETE FROM machine_daily WHERE machine_id=?", (mid,))
+            c.execute("DELETE FROM machines WHERE id=?", (mid,))
+            
+        # Add
+        for m_num in to_add:
+            c.execute("INSERT OR IGNORE INTO machines (store_id, machine_number, avg_out_balls, avg_base, total_spins, total_out_balls) VALUES (?, ?, 1400.0, 20.0, 0, 0)", (store_id, m_num))
         
+        # One-off rebuild of the islands whose machines changed
+        if to_remove or to_add:
+            _recompute_groups(c, _groups_of_machines(c, store_id, to_remove | to_add))
+            bump_data_version(store_id)
+    if to_remove:
+        invalidate_machine_ids(store_id)
+    if to_remove or to_add:
+        invalidate_store_index(store_id)
+
+def get_all_machines_status(store_id, days=None):
+    """
+    Display rows for every machine of the store, built from one grouped query
+    (lifetime, or the last `days` days).
+    """
+    data = []
+    for _, m, remarks, t_spins, t_inv, t_hits, t_out, _ in get_store_machine_aggregates(store_id, days):
         # Format: 21.5 (4300/200.0)
         if t_spins > 0:
             inv_units = t_inv / 250.0
+            wb = t_spins / inv_units if inv_units > 0 else 0
+            wo = t_out / t_hits if t_hits > 0 else 1400.0
             rate_disp = f"{wb:.1f} ({t_spins:,}/{inv_units:,.1f})"
             out_disp = f"{int(wo):,} ({t_out:,}/{t_hits})"
         else:
@@ -422,48 +1063,113 @@ def get_all_machines_status(store_id):
             "出玉(詳細)": out_disp,
             "備考": remarks
         })
-        
-    conn.close()
     return data
 
+def get_store_machine_aggregates(store_id, days=None):
+    """
+    Returns one row per machine of the store, from the running totals
+    (or summed daily rollups of the last `days` days):
+    (machine_id, machine_number, remarks, t_spins, t_inv_balls, t_hits, t_out_balls, record_count)
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        if days:
+            c.execute("""SELECT m.id, m.machine_number, m.remarks, COALESCE(SUM(d.spins), 0), COALESCE(SUM(d.investment_balls), 0),
+                                COALESCE(SUM(d.hits), 0), COALESCE(SUM(d.out_balls), 0), COALESCE(SUM(d.record_count), 0)
+                         FROM machines m
+                         LEFT JOIN machine_daily d ON d.machine_id = m.id AND d.date >= ?
+                         WHERE m.store_id=?
+                         GROUP BY m.id
+                         ORDER BY m.machine_number ASC""", (window_start(days), store_id))
+            return c.fetchall()
+        c.execute("""SELECT id, machine_number, remarks, total_spins, total_investment_balls,
+                            total_hits, total_out_balls, record_count
+                     FROM machines
+                     WHERE store_id=?
+                     ORDER BY machine_number ASC""", (store_id,))
+        return c.fetchall()
+
 def get_machine_history(store_id, machine_number, limit=5):
-    mid, _ = get_or_create_machine(store_id, machine_number)
-    conn = sqlite3.connect(DB_PATH)
-    # columns: id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated
-    df = pd.read_sql_query("SELECT id, date, investment_balls/250.0 as inv_units, spins, hits, out_balls, base_calculated, out_10r_calculated FROM records WHERE machine_id=? ORDER BY id DESC LIMIT ?", 
-                           conn, params=(mid, limit))
-    conn.close()
-    return df
+    # Unknown machine: machine_id=NULL matches nothing (empty frame, same columns)
+    import pandas as pd
+    mid = resolve_machine(store_id, machine_number)
+    with connection() as conn:
+        # columns: id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated
+        return pd.read_sql_query("SELECT id, date, investment_balls/250.0 as inv_units, spins, hits, out_balls, base_calculated, out_10r_calculated FROM records WHERE machine_id=? ORDER BY id DESC LIMIT ?", 
+                                 conn, params=(mid, limit))
 
+@retry_on_busy
 def delete_record_by_id(record_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Get machine_id first to update stats later
-    c.execute("SELECT machine_id FROM records WHERE id=?", (record_id,))
-    res = c.fetchone()
-    if res:
-        mid = res[0]
-        # Backup to deleted_records
+    with transaction() as c:
+        # Backup to deleted_records (machine_id is kept to update stats)
         c.execute("SELECT * FROM records WHERE id=?", (record_id,))
         row = c.fetchone()
-        if row:
-            # records row: 0:id, 1:mid, 2:date, 3:inv, 4:spins, 5:hits, 6:out, 7:base, 8:out10r
-            c.execute('''INSERT INTO deleted_records 
-                         (original_record_id, machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                      (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8]))
+        if not row:
+            return False
+        
+        # records row: 0:id, 1:mid, 2:date, 3:inv, 4:spins, 5:hits, 6:out, 7:base, 8:out10r
+        mid = row[1]
+        c.execute('''INSERT INTO deleted_records 
+                     (original_record_id, machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8]))
         
         # Delete
         c.execute("DELETE FROM records WHERE id=?", (record_id,))
         
-        # Update machine stats
-        update_machine_stats(c, mid)
-        conn.commit()
-        conn.close()
-        return True
-    conn.close()
-    return False
+        # Subtract from running totals
+        _apply_record_delta(c, mid, -1, row[2], row[3], row[4], row[5], row[6])
+        # The store is not known here without another lookup
+        bump_data_version()
+    return True
+
+def _weighted_totals(row):
+    """
+    (weighted_base, weighted_avg_out, t_spins, t_inv_balls, t_out_balls, t_hits, record_count)
+    from a (t_spins, t_inv_balls, t_hits, t_out_balls, record_count) row.
+    """
+    if not row or not row[0]:
+        return 0, 1400.0, 0, 0, 0, 0, 0
+    t_spins, t_inv_balls, t_hits, t_out_balls, record_count = row
+    inv_units = t_inv_balls / 250.0
+    weighted_base = t_spins / inv_units if inv_units > 0 else 0
+    weighted_out = t_out_balls / t_hits if t_hits > 0 else 1400.0
+    return weighted_base, weighted_out, t_spins, t_inv_balls, t_out_balls, t_hits, record_count
+
+_GROUP_WINDOW_SQL = """SELECT g.name, SUM(d.spins), SUM(d.investment_balls), SUM(d.hits), SUM(d.out_balls), SUM(d.record_count)
+                        FROM model_groups g
+                        LEFT JOIN model_group_members gm ON gm.group_id = g.id
+                        LEFT JOIN machines m ON m.store_id = gm.store_id AND m.machine_number = gm.machine_number
+                        LEFT JOIN machine_daily d ON d.machine_id = m.id AND d.date >= ?
+                        WHERE g.store_id=? {} GROUP BY g.id"""
+
+def get_group_weighted_stats(store_id, group_name, days=None):
+    """
+    Island stats of a stored model group (single-row read); same tuple as get_model_weighted_stats.
+    With days, summed from the members' daily rollups of the last `days` days.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        if days:
+            c.execute(_GROUP_WINDOW_SQL.format("AND g.name=?"), (window_start(days), store_id, group_name))
+            row = c.fetchone()
+            return _weighted_totals(row[1:] if row else None)
+        c.execute("""SELECT total_spins, total_investment_balls, total_hits, total_out_balls, record_count
+                     FROM model_groups WHERE store_id=? AND name=?""", (store_id, group_name))
+        return _weighted_totals(c.fetchone())
+
+def get_store_group_stats(store_id, days=None):
+    """
+    {group_name: get_group_weighted_stats tuple} for every model group of the store.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        if days:
+            c.execute(_GROUP_WINDOW_SQL.format(""), (window_start(days), store_id))
+            return {row[0]: _weighted_totals(row[1:]) for row in c.fetchall()}
+        c.execute("""SELECT name, total_spins, total_investment_balls, total_hits, total_out_balls, record_count
+                     FROM model_groups WHERE store_id=?""", (store_id,))
+        return {row[0]: _weighted_totals(row[1:]) for row in c.fetchall()}
 
 def get_model_weighted_stats(store_id, machine_numbers):
     """
@@ -472,40 +1178,35 @@ def get_model_weighted_stats(store_id, machine_numbers):
     if not machine_numbers:
         return 0, 1400.0, 0, 0, 0, 0, 0
         
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Get IDs for these machine numbers
-    placeholders = ','.join(['?'] * len(machine_numbers))
-    query = f"SELECT id FROM machines WHERE store_id=? AND machine_number IN ({placeholders})"
-    c.execute(query, [store_id] + list(machine_numbers))
-    mid_rows = c.fetchall()
-    mids = [r[0] for r in mid_rows]
-    
-    if not mids:
-        conn.close()
-        return 0, 1400.0, 0, 0, 0, 0, 0
-        
-    # Aggregate stats across all records for these machines
-    mid_placeholders = ','.join(['?'] * len(mids))
-    c.execute(f"SELECT SUM(spins), SUM(investment_balls), SUM(hits), SUM(out_balls), COUNT(id) FROM records WHERE machine_id IN ({mid_placeholders})", mids)
-    row = c.fetchone()
-    conn.close()
-    
-    if not row or not row[0]:
-        return 0, 1400.0, 0, 0, 0, 0, 0
+    with connection() as conn:
+        c = conn.cursor()
         
-    t_spins = row[0]
-    t_inv_balls = row[1]
-    t_hits = row[2]
-    t_out_balls = row[3]
-    record_count = row[4]
-    
-    # Weighted Base
-    inv_units = t_inv_balls / 250.0
-    weighted_base = t_spins / inv_units if inv_units > 0 else 0
-    
-    # Weighted Avg Out
-    weighted_out = t_out_balls / t_hits if t_hits > 0 else 1400.0
+        # Sum the running totals of these machines
+        placeholders = ','.join(['?'] * len(machine_numbers))
+        c.execute(f"""SELECT SUM(total_spins), SUM(total_investment_balls), SUM(total_hits), SUM(total_out_balls), SUM(record_count)
+                      FROM machines WHERE store_id=? AND machine_number IN ({placeholders})""",
+                  [store_id] + list(machine_numbers))
+        row = c.fetchone()
     
-    return weighted_base, weighted_out, t_spins, t_inv_balls, t_out_balls, t_hits, record_count
+    return _weighted_totals(row)
+
+if __name__ == "__main__":
+    # Aggregate check: python database.py verify [--fix]
+    import argparse
+    parser = argparse.ArgumentParser(description="pachinko.db maintenance")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--fix", action="store_true", help="rebuild drifted machine totals")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    DB_PATH = args.db
+    init_db()
+    drift = verify_machine_aggregates(fix=args.fix)
+    for mid, stored, actual in drift:
+        print(f"machine {mid}: stored {stored} != records {actual}")
+    print(f"{len(drift)} machine(s) drifted" + (" (rebuilt)" if args.fix and drift else ""))
+    group_drift = verify_group_aggregates(fix=args.fix)
+    for gid, stored, actual in group_drift:
+        print(f"model group {gid}: stored {stored} != members {actual}")
+    print(f"{len(group_drift)} model group(s) drifted" + (" (rebuilt)" if args.fix and group_drift else ""))
+    daily_drift = verify_daily_rollups(fix=args.fix)
+    print(f"{len(daily_drift)} machine(s) with drifted daily rollups" + (" (rebuilt)" if args.fix and daily_drift else ""))
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+import logic
+from model_registry import get_model
+
+GRID_DIR = 'ev_grid'
+GRID_FORMAT = 1
+
+# Lattice = the st.number_input steps of the calculator in app.py: (start, stop, step)
+# Exchange rate is not a lattice axis: EV is exactly linear in 100 / rate,
+# so it is applied at lookup time instead of storing 301 rate slices.
+LATTICE = {
+    "spins": (0.0, 1500.0, 10.0),
+    "base": (10.0, 30.0, 0.1),
+    "out": (1300.0, 1550.0, 5.0)
+}
+
+# Relative tolerance (in steps) for treating an input as an exact lattice hit
+SNAP_TOL = 1e-6
+
+def _axis(name):
+    start, stop, step = LATTICE[name]
+    n = int(round((stop - start) / step)) + 1
+    # Round so 20.1 on the axis is the same float the number_input produces
+    return np.round(start + step * np.arange(n), 6)
+
+def grid_digest(model):
+    """
+    Version key of a grid: changes whenever the model's anchor tables,
+    the lattice or the file format change.
+    """
+    payload = json.dumps({"spec": model.spec, "lattice": LATTICE, "format": GRID_FORMAT},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def _model_prefix(model):
+    return "ev_" + hashlib.sha1(model.name.encode('utf-8')).hexdigest()[:8] + "_"
+
+def grid_path(model, grid_dir=None):
+    return os.path.join(grid_dir or GRID_DIR, _model_prefix(model) + grid_digest(model))
+
+def build_grid(model_type, grid_dir=None):
+    """
+    Computes the lattice for one model and writes it to disk:
+    profit.npy (spins x base x out), yu.npy (spins x out), gain.npy (spins).
+    Older versions of the same model's grid are removed.
+    """
+    model = get_model(model_type)
+    grid_dir = grid_dir or GRID_DIR
+    os.makedirs(grid_dir, exist_ok=True)
+
+    spins, base, out = _axis("spins"), _axis("base"), _axis("out")
+    profit, gain, yu = logic.expectation_components(
+        base[None, :, None], spins[:, None, None], out[None, None, :], model.name)
+
+    target = grid_path(model, grid_dir)
+    tmp = tempfile.mkdtemp(dir=grid_dir)
+    np.save(os.path.join(tmp, 'profit.npy'), np.ascontiguousarray(profit))
+    np.save(os.path.join(tmp, 'yu.npy'), np.ascontiguousarray(yu[:, 0, :]))
+    np.save(os.path.join(tmp, 'gain.npy'), np.ascontiguousarray(gain[:, 0, 0]))
+    if os.path.isdir(target):
+        shutil.rmtree(tmp)
+    else:
+        os.replace(tmp, target)
+
+    # Drop stale versions of this model's grid
+    prefix = _model_prefix(model)
+    for entry in os.listdir(grid_dir):
+        path = os.path.join(grid_dir, entry)
+        if entry.startswith(prefix) and path != target:
+            shutil.rmtree(path, ignore_errors=True)
+    return target
+
+class EVGrid:
+    """
+    Memory-mapped EV lattice for one model.
+    lookup() returns exact values on lattice points and multilinear
+    interpolation between them; inputs outside the lattice are computed directly.
+    """
+    def __init__(self, model_type, path):
+        self.model_type = model_type
+        self.path = path
+        self.profit = np.load(os.path.join(path, 'profit.npy'), mmap_mode='r')
+        self.yu = np.load(os.path.join(path, 'yu.npy'), mmap_mode='r')
+        self.gain = np.load(os.path.join(path, 'gain.npy'), mmap_mode='r')
+
+    @staticmethod
+    def _locate(name, x):
+        """
+        Returns (lower index, fraction, in_range) along one lattice axis.
+        Inputs within SNAP_TOL steps of a lattice point snap onto it.
+        """
+        start, stop, step = LATTICE[name]
+        n = int(round((stop - start) / step)) + 1
+        pos = (x - start) / step
+        nearest = np.round(pos)
+        pos = np.where(np.abs(pos - nearest) < SNAP_TOL, nearest, pos)
+        in_range = (pos >= 0) & (pos <= n - 1)
+        i0 = np.clip(np.floor(pos), 0, n - 2).astype(np.intp)
+        frac = np.clip(pos - i0, 0.0, 1.0)
+        return i0, frac, in_range
+
+    def lookup(self, base, remaining_spins, exchange_rate=27.0, actual_10r_out=1400.0):
+        """
+        EV (truncated Yen) for broadcastable inputs; returns int for scalar inputs.
+        """
+        base, s, rate, out = np.broadcast_arrays(
+            np.asarray(base, dtype=float),
+            np.asarray(remaining_spins, dtype=float),
+            np.asarray(exchange_rate, dtype=float),
+            np.asarray(actual_10r_out, dtype=float)
+        )
+        si, sf, s_ok = self._locate("spins", s)
+        bi, bf, b_ok = self._locate("base", base)
+        oi, of, o_ok = self._locate("out", out)
+
+        profit = np.zeros(s.shape)
+        for ds, ws in ((0, 1.0 - sf), (1, sf)):
+            for db, wb in ((0, 1.0 - bf), (1, bf)):
+                for do, wo in ((0, 1.0 - of), (1, of)):
+                    w = ws * wb * wo
+                    # Skip zero-weight corners so lattice hits return stored values exactly
+                    profit = profit + np.where(w > 0, self.profit[si + ds, bi + db, oi + do] * w, 0.0)
+        yu = np.zeros(s.shape)
+        for ds, ws in ((0, 1.0 - sf), (1, sf)):
+            for do, wo in ((0, 1.0 - of), (1, of)):
+                w = ws * wo
+                yu = yu + np.where(w > 0, self.yu[si + ds, oi + do] * w, 0.0)
+        gain = np.where(sf > 0, self.gain[si] * (1.0 - sf) + self.gain[si + 1] * sf, self.gain[si])
+
+        ev = np.array(logic.combine_expectation(profit, gain, yu, s, rate))
+
+        outside = ~(s_ok & b_ok & o_ok)
+        if outside.any():
+            ev[outside] = logic.calculate_expectation_batch(
+                base[outside], s[outside], rate[outside], out[outside], self.model_type)
+        return int(ev) if ev.ndim == 0 else ev
+
+_grids = {}
+
+def get_grid(model_type, grid_dir=None):
+    """
+    Opens the model's grid, building it only if no file matches the
+    current anchor tables (new model or edited models.json).
+    """
+    model = get_model(model_type)
+    path = grid_path(model, grid_dir)
+    grid = _grids.get(model.name)
+    if grid is not None and grid.path == path:
+        return grid
+    if not os.path.isdir(path):
+        build_grid(model.name, grid_dir)
+    grid = EVGrid(model.name, path)
+    _grids[model.name] = grid
+    return grid
+
+def lookup_expectation(base, remaining_spins, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP"):
+    return get_grid(model_type).lookup(base, remaining_spins, exchange_rate, actual_10r_out)
+
+if __name__ == "__main__":
+    # Prebuild grids: python ev_grid.py [model ...]
+    from model_registry import get_registry
+    for name in sys.argv[1:] or get_registry().names():
+        print(f"{name}: {build_grid(name)}")
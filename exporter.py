@@ -0,0 +1,133 @@
+"""
+Streaming export of records to CSV or Parquet.
+
+    python exporter.py history.csv [--store 店名 | --store-id 1] [--from 2025-01-01] [--to 2025-12-31]
+    python exporter.py history.parquet --no-join
+
+Rows are read with fetchmany() in fixed-size chunks and written as they
+arrive, so memory use does not grow with the table. Parquet needs pyarrow
+(optional, imported only when a .parquet export is requested).
+"""
+import argparse
+import csv
+import os
+
+import database as db
+
+CHUNK_SIZE = 10000
+
+JOINED_COLUMNS = [
+    ("id", "int64"), ("store", "string"), ("machine_number", "int64"), ("date", "string"),
+    ("investment_balls", "int64"), ("spins", "int64"), ("hits", "int64"), ("out_balls", "int64"),
+    ("base_calculated", "float64"), ("out_10r_calculated", "float64"),
+]
+PLAIN_COLUMNS = [("id", "int64"), ("machine_id", "int64")] + JOINED_COLUMNS[3:]
+
+def _query(join, store, date_from, date_to):
+    if join:
+        sql = """SELECT r.id, s.name, m.machine_number, r.date, r.investment_balls, r.spins, r.hits,
+                        r.out_balls, r.base_calculated, r.out_10r_calculated
+                 FROM records r
+                 LEFT JOIN machines m ON m.id = r.machine_id
+                 LEFT JOIN stores s ON s.id = m.store_id"""
+    else:
+        sql = """SELECT r.id, r.machine_id, r.date, r.investment_balls, r.spins, r.hits,
+                        r.out_balls, r.base_calculated, r.out_10r_calculated
+                 FROM records r"""
+    where, params = [], []
+    if store is not None:
+        if isinstance(store, int):
+            where.append("r.machine_id IN (SELECT id FROM machines WHERE store_id=?)")
+        else:
+            where.append("r.machine_id IN (SELECT m2.id FROM machines m2 JOIN stores s2 ON s2.id = m2.store_id WHERE s2.name=?)")
+        params.append(store)
+    if date_from:
+        where.append("r.date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("r.date <= ?")
+        params.append(date_to)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY r.id", params
+
+def iter_record_chunks(store=None, date_from=None, date_to=None, join=True, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of at most chunk_size record tuples, in id order.
+    store: store name or id; date_from / date_to: inclusive 'YYYY-MM-DD'.
+    join=True replaces machine_id with store name and machine number
+    (column names: JOINED_COLUMNS / PLAIN_COLUMNS).
+    The pooled connection stays checked out while iterating; under WAL the
+    read does not block writers.
+    """
+    sql, params = _query(join, store, date_from, date_to)
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute(sql, params)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+def _write_csv(path, columns, chunks):
+    count = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+def _write_parquet(path, columns, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(name, pa.string() if kind == "string" else getattr(pa, kind)())
+                        for name, kind in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            arrays = [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+def export_records(path, fmt=None, store=None, date_from=None, date_to=None, join=True, chunk_size=CHUNK_SIZE):
+    """
+    Writes records to path as CSV or Parquet (fmt defaults to the file extension).
+    Returns the number of rows written.
+    """
+    if fmt is None:
+        fmt = 'parquet' if os.path.splitext(path)[1].lower() in ('.parquet', '.pq') else 'csv'
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"unknown export format: {fmt}")
+    columns = JOINED_COLUMNS if join else PLAIN_COLUMNS
+    chunks = iter_record_chunks(store, date_from, date_to, join, chunk_size)
+    if fmt == 'parquet':
+        return _write_parquet(path, columns, chunks)
+    return _write_csv(path, columns, chunks)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export records to CSV or Parquet")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "parquet"])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--store", help="store name (also for all-digit names such as 999)")
+    group.add_argument("--store-id", type=int, help="store id")
+    parser.add_argument("--from", dest="date_from", help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="last date, YYYY-MM-DD")
+    parser.add_argument("--no-join", action="store_true", help="keep machine_id instead of store / machine number")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--db", default=db.DB_PATH)
+    args = parser.parse_args()
+    db.DB_PATH = args.db
+
+    store = args.store_id if args.store_id is not None else args.store
+    n = export_records(args.path, args.format, store, args.date_from, args.date_to,
+                       join=not args.no_join, chunk_size=args.chunk_size)
+    print(f"{n:,} records -> {args.path}")
@@ -0,0 +1,284 @@
+"""
+Bulk loader for historical session logs (CSV or JSON Lines).
+
+    python importer.py logs.csv [--rejects logs.rejects.jsonl] [--create-stores]
+
+One row per session with the columns
+    store (name) or store_id, machine_number, investment_balls, spins, hits, out_balls, date
+(`investment` is accepted for investment_balls; a missing date means today).
+Rows are streamed from disk and inserted in chunked transactions; malformed
+rows are written to the rejects file instead of aborting the load.
+Machine numbers must match the store's configuration (store_config.py),
+since applying it drops unknown machines together with their records.
+"""
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import database as db
+
+CHUNK_SIZE = 10000
+
+INT_FIELDS = ("machine_number", "investment_balls", "spins", "hits", "out_balls")
+MAX_INT = 2 ** 63 - 1     # SQLite INTEGER / np.int64
+
+def read_rows(path):
+    """
+    Yields (line_number, dict) from a .csv or .jsonl/.json file without loading it whole.
+    Lines that are not valid JSON are yielded as (line_number, ValueError).
+    """
+    if os.path.splitext(path)[1].lower() in ('.jsonl', '.json', '.ndjson'):
+        with open(path, encoding='utf-8') as f:
+            for i, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield i, ValueError(f"invalid JSON: {e}")
+                    continue
+                yield i, row if isinstance(row, dict) else ValueError("not a JSON object")
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+def _parse_date(raw, seen):
+    """
+    Normalized YYYY-MM-DD; seen memoizes already validated strings
+    (log files repeat the same few hundred dates).
+    """
+    date = seen.get(raw)
+    if date is None:
+        try:
+            date = datetime.datetime.strptime(raw, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"date must be YYYY-MM-DD: {raw!r}")
+        seen[raw] = date
+    return date
+
+def _parse_int(raw):
+    """
+    Exact integer value of raw (1400, "1400", "1400.0"); None if it is not a
+    finite whole number (e.g. "abc", "1.5", "inf", "nan").
+    """
+    try:
+        return int(str(raw).strip())
+    except ValueError:
+        pass
+    try:
+        num = float(raw)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(num) or num != int(num):
+        return None
+    return int(num)
+
+def _parse_row(row, store_ids, today, dates):
+    """
+    Returns (store_key, machine_number, date, investment, spins, hits, out_balls);
+    raises ValueError with the reason for a malformed row.
+    """
+    if 'investment_balls' not in row and 'investment' in row:
+        row = dict(row, investment_balls=row['investment'])
+    values = {}
+    for field in INT_FIELDS:
+        raw = row.get(field)
+        if raw is None or str(raw).strip() == "":
+            if field == "hits":
+                raw = 0
+            else:
+                raise ValueError(f"missing {field}")
+        num = _parse_int(raw)
+        if num is None:
+            raise ValueError(f"{field} is not an integer: {raw!r}")
+        if not 0 <= num <= MAX_INT:
+            raise ValueError(f"{field} must be a non-negative integer up to {MAX_INT}: {raw!r}")
+        values[field] = num
+
+    if row.get('store_id') not in (None, ""):
+        try:
+            store = int(row['store_id'])
+        except (TypeError, ValueError):
+            raise ValueError(f"store_id is not an integer: {row['store_id']!r}")
+        if store not in store_ids.values():
+            raise ValueError(f"unknown store_id {store}")
+    else:
+        store = str(row.get('store') or "").strip()
+        if not store:
+            raise ValueError("missing store")
+
+    date = _parse_date(str(row.get('date') or "").strip() or today, dates)
+
+    return (store, values["machine_number"], date, values["investment_balls"],
+            values["spins"], values["hits"], values["out_balls"])
+
+def _calculated_columns(investment, spins, hits, out_balls):
+    """
+    base_calculated / out_10r_calculated for a whole chunk, with the same
+    arithmetic as add_record (0.0 where there is no investment / no hit).
+    """
+    inv_units = investment / 250.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base_cal = np.where(inv_units > 0, spins / inv_units, 0.0)
+        out_10r_cal = np.where(hits > 0, out_balls / hits, 0.0)
+    return base_cal, out_10r_cal
+
+def _machine_ids(c, cache, store_id, numbers):
+    """
+    Resolves machine numbers of one store to ids, creating missing machines
+    with one executemany. cache: {store_id: {machine_number: id}}.
+    """
+    known = cache.get(store_id)
+    if known is None:
+        c.execute("SELECT machine_number, id FROM machines WHERE store_id=?", (store_id,))
+        known = cache[store_id] = dict(c.fetchall())
+    missing = set(numbers) - known.keys()
+    if missing:
+        c.executemany("INSERT OR IGNORE INTO machines (store_id, machine_number) VALUES (?, ?)",
+                      [(store_id, num) for num in sorted(missing)])
+        placeholders = ','.join(['?'] * len(missing))
+        c.execute(f"SELECT machine_number, id FROM machines WHERE store_id=? AND machine_number IN ({placeholders})",
+                  [store_id] + sorted(missing))
+        known.update(c.fetchall())
+    return known
+
+def _resolve_stores(c, store_ids, names, create_stores):
+    missing = {n for n in names if isinstance(n, str) and n not in store_ids}
+    if missing and create_stores:
+        c.executemany("INSERT OR IGNORE INTO stores (name) VALUES (?)", [(n,) for n in sorted(missing)])
+        c.execute("SELECT name, id FROM stores")
+        store_ids.update(c.fetchall())
+
+def _insert_chunk(rows, store_ids, machine_cache, touched, create_stores):
+    """
+    Inserts one chunk of parsed rows in a single transaction.
+    Returns [(line, row, reason)] for rows whose store could not be resolved.
+    """
+    rejected = []
+    with db.transaction() as c:
+        _resolve_stores(c, store_ids, {r[1][0] for r in rows}, create_stores)
+
+        by_store = {}
+        kept = []
+        for line, row in rows:
+            store = row[0]
+            sid = store if isinstance(store, int) else store_ids.get(store)
+            if sid is None:
+                rejected.append((line, row, f"unknown store {store!r}"))
+                continue
+            by_store.setdefault(sid, set()).add(row[1])
+            kept.append((sid, row))
+        if not kept:
+            return rejected
+
+        ids = {sid: _machine_ids(c, machine_cache, sid, nums) for sid, nums in by_store.items()}
+        mids = [ids[sid][row[1]] for sid, row in kept]
+        numeric = np.array([row[3:7] for _, row in kept], dtype=np.int64)
+        base_cal, out_10r_cal = _calculated_columns(*numeric.T.astype(float))
+
+        c.executemany("INSERT INTO records (machine_id, date, investment_balls, spins, hits, out_balls, base_calculated, out_10r_calculated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                      [(mid, row[2], row[3], row[4], row[5], row[6], float(b), float(o))
+                       for mid, (_, row), b, o in zip(mids, kept, base_cal, out_10r_cal)])
+        touched.update(mids)
+    return rejected
+
+def import_records(path, rejects_path=None, chunk_size=CHUNK_SIZE, create_stores=False, progress=None):
+    """
+    Streams a CSV / JSON Lines file into records.
+    Each chunk of chunk_size rows is one transaction; machine running totals
+    are rebuilt once per touched machine after the last chunk (if the load is
+    interrupted, `python database.py verify --fix` repairs them).
+    Unknown stores are rejected unless create_stores is set.
+    Returns {"rows", "imported", "rejected", "machines", "seconds", "rows_per_sec", "rejects_path"}.
+    """
+    db.init_db()
+    if rejects_path is None:
+        rejects_path = os.path.splitext(path)[0] + '.rejects.jsonl'
+    today = datetime.date.today().strftime('%Y-%m-%d')
+
+    with db.connection() as conn:
+        store_ids = dict(conn.execute("SELECT name, id FROM stores").fetchall())
+    machine_cache = {}
+    dates = {}
+    touched = set()
+    total = rejected = 0
+    rejects_file = None
+    start = time.perf_counter()
+
+    def reject(line, row, reason):
+        nonlocal rejects_file, rejected
+        if rejects_file is None:
+            rejects_file = open(rejects_path, 'w', encoding='utf-8')
+        record = {"line": line, "error": reason, "row": row}
+        rejects_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        rejected += 1
+
+    def flush(chunk):
+        for line, row, reason in _insert_chunk(chunk, store_ids, machine_cache, touched, create_stores):
+            reject(line, list(row), reason)
+        if progress:
+            progress(total, total - rejected)
+
+    try:
+        chunk = []
+        for line, row in read_rows(path):
+            total += 1
+            if isinstance(row, Exception):
+                reject(line, None, str(row))
+                continue
+            try:
+                chunk.append((line, _parse_row(row, store_ids, today, dates)))
+            except ValueError as e:
+                reject(line, row, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+        # Rebuild the running totals of every touched machine in one transaction
+        with db.transaction() as c:
+            for mid in touched:
+                db.update_machine_stats(c, mid)
+            # Only invalidates read caches in this process; a running app sees
+            # the rows after its cache ttl (see README, Database)
+            db.bump_data_version()
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": total,
+        "imported": total - rejected,
+        "rejected": rejected,
+        "machines": len(touched),
+        "seconds": seconds,
+        "rows_per_sec": total / seconds if seconds > 0 else 0.0,
+        "rejects_path": rejects_path if rejected else None
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import of session records (CSV / JSON Lines)")
+    parser.add_argument("path")
+    parser.add_argument("--rejects", help="side file for malformed rows (default: <path>.rejects.jsonl)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--create-stores", action="store_true", help="create stores that do not exist yet")
+    parser.add_argument("--db", default=db.DB_PATH)
+    args = parser.parse_args()
+    db.DB_PATH = args.db
+
+    stats = import_records(args.path, args.rejects, args.chunk_size, args.create_stores)
+    print(f"{stats['imported']:,} / {stats['rows']:,} rows imported into {stats['machines']:,} machine(s) "
+          f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec)")
+    if stats["rejected"]:
+        print(f"{stats['rejected']:,} row(s) rejected -> {stats['rejects_path']}")
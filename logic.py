@@ -1,3 +1,7 @@
+import numpy as np
+
+from model_registry import get_model
+
 
 def get_table_revenue(spins):
     """
@@ -45,58 +49,26 @@ def get_table_revenue(spins):
     val = p1[1] + (s - p1[0]) * slope
     
     return val
+
 def calculate_expectation(base, remaining_spins, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP"):
     """
     Calculates EV using model-specific anchor points.
-    model_type: "大海4SP" or "大海5SP"
+    model_type: a name or alias from models.json (unknown names use the default model)
     """
     s = float(remaining_spins)
     if s <= 0: return 0
     if base <= 0: base = 1.0
     
     # 1. Machine Specific Parameters
-    if model_type == "大海5SP":
-        p = 1.0 / 319.6  # Sea Story 5 SP
-        std_out = 1400.0
-        border_points = [
-            (100, 6.09),
-            (200, 9.91),
-            (300, 12.41),
-            (400, 14.12),
-            (500, 15.30),
-            (600, 16.15)
-        ]
-    else:
-        # Default: 大海4SP
-        p = 1.0 / 319.7
-        std_out = 1400.0
-        border_points = [
-            (100, 6.64),
-            (200, 10.64),
-            (300, 13.20),
-            (400, 14.91),
-            (500, 16.09),
-            (600, 16.90)
-        ]
+    model = get_model(model_type)
+    p = model.p
     
     # Interpolate Border at std_out
-    if s <= 100:
-        p1, p2 = border_points[0], border_points[1]
-    elif s >= 600:
-        p1, p2 = border_points[-2], border_points[-1]
-    else:
-        p1, p2 = border_points[0], border_points[1]
-        for i in range(len(border_points) - 1):
-            if border_points[i][0] <= s <= border_points[i+1][0]:
-                p1, p2 = border_points[i], border_points[i+1]
-                break
-    
-    slope = (p2[1] - p1[1]) / (p2[0] - p1[0])
-    border_std = p1[1] + (s - p1[0]) * slope
-    border_std = max(2.0, min(19.0, border_std))
+    border_std = model.border(s)
+    border_std = max(model.border_min, min(model.border_max, border_std))
     
     # 2. Adjust Border for User's actual_10r_out
-    border_adj = border_std * (std_out / actual_10r_out)
+    border_adj = border_std * (model.std_out / actual_10r_out)
     
     # 3. Expected Spins (accounts for hitting before S)
     prob_no_hit = (1.0 - p) ** s
@@ -112,44 +84,16 @@ def calculate_expectation(base, remaining_spins, exchange_rate=27.0, actual_10r_
     yen_per_ball = 100.0 / exchange_rate
     ev_yen = profit_balls * yen_per_ball
 
-    # 6. Exploit: Add provided gain in Yen for 大海5SP
-    if model_type == "大海5SP":
-        # --- A. Remaining Ball Gain (from previous instructions) ---
-        # Data points provided by user (remaining_spins, gain_yen)
-        gain_points = [
-            (100, 77.5),
-            (200, 70.5),
-            (300, 65.5),
-            (400, 61.8),
-            (500, 59.1),
-            (600, 57.1)
-        ]
-        
-        target_s = s
-        if target_s <= 100:
-            g_yen = gain_points[0][1]
-        elif target_s >= 600:
-            g_yen = gain_points[-1][1]
-        else:
-            # Linear Interpolation
-            p1, p2 = gain_points[0], gain_points[1]
-            for i in range(len(gain_points) - 1):
-                if gain_points[i][0] <= target_s <= gain_points[i+1][0]:
-                    p1, p2 = gain_points[i], gain_points[i+1]
-                    break
-            g_slope = (p2[1] - p1[1]) / (p2[0] - p1[0])
-            g_yen = p1[1] + (target_s - p1[0]) * g_slope
-            
-        ev_yen += g_yen
+    # 6. Exploit: model-specific gains (e.g. 大海5SP)
+    # --- A. Remaining Ball Gain ---
+    if model.gain is not None:
+        ev_yen += model.gain(s)
 
-        # --- B. Electric Support Support (D) and Yu-Time Gain ---
-        # Theoretical Attacker Payout = 1389.0
-        # Avg Support Spins per hit = 85.0
-        # D = (Actual - Theoretical) / 85.0
-        d_rate = (actual_10r_out - 1389.0) / 85.0
-        
-        # Yu-Time duration = 350 spins
-        yu_gain_balls = 350.0 * d_rate
+    # --- B. Electric Support (D) and Yu-Time Gain ---
+    if model.has_yu_support:
+        # D = (Actual - Theoretical Attacker Payout) / Avg Support Spins per hit
+        d_rate = (actual_10r_out - model.yu_theoretical_out) / model.yu_support_spins
+        yu_gain_balls = model.yu_duration * d_rate
         
         # Probability of reaching Yu-Time = prob_no_hit (calculated at step 3)
         ev_yu_yen = (prob_no_hit * yu_gain_balls) * yen_per_ball
@@ -158,94 +102,186 @@ def calculate_expectation(base, remaining_spins, exchange_rate=27.0, actual_10r_
     
     return int(ev_yen)
 
-def get_estimated_time(remaining_spins, model_type="大海4SP"):
+def base_free_terms(remaining_spins, actual_10r_out, model):
     """
-    Returns estimated total time (minutes) to finish the session, 
-    based on user-provided simulation data.
+    Terms of the EV model that do not depend on base:
+    (expected_spins, rev_balls, gain_yen, yu_balls) as arrays.
+    model: a model_registry model (get_model(model_type)); used by planner.
     """
-    if model_type == "大海5SP":
-        # Refined measured data for Sea Story 5 SP
-        points = [
-            (100, 35.0),
-            (200, 45.0),
-            (300, 53.0),
-            (400, 59.0),
-            (450, 61.0),
-            (500, 63.0)
-        ]
-    else:
-        # Default: 大海4SP
-        points = [
-            (100, 46.0),
-            (200, 57.0),
-            (300, 64.0),
-            (400, 70.0),
-            (500, 74.0)
-        ]
+    s = remaining_spins
+    p = model.p
     
-    s = float(remaining_spins)
+    border_std = model.border.evaluate(s)
+    border_std = np.maximum(model.border_min, np.minimum(model.border_max, border_std))
     
-    if s <= 100:
-        p1, p2 = points[0], points[1]
-    elif s >= 500:
-        p1, p2 = points[-2], points[-1]
+    # 2. Adjust Border for User's actual_10r_out
+    border_adj = border_std * (model.std_out / actual_10r_out)
+    
+    # 3. Expected Spins (accounts for hitting before S)
+    prob_no_hit = (1.0 - p) ** s
+    expected_spins = (1.0 - prob_no_hit) / p
+    
+    rev_balls = (expected_spins / border_adj) * 250.0
+    
+    # 6. Exploit: model-specific gains (e.g. 大海5SP)
+    if model.gain is not None:
+        gain_yen = model.gain.evaluate(s)
     else:
-        p1, p2 = points[0], points[1]
-        for i in range(len(points) - 1):
-            if points[i][0] <= s <= points[i+1][0]:
-                p1, p2 = points[i], points[i+1]
-                break
+        gain_yen = np.zeros_like(s)
     
-    slope = (p2[1] - p1[1]) / (p2[0] - p1[0])
-    est_min = p1[1] + (s - p1[0]) * slope
+    if model.has_yu_support:
+        d_rate = (actual_10r_out - model.yu_theoretical_out) / model.yu_support_spins
+        yu_gain_balls = model.yu_duration * d_rate
+        yu_balls = prob_no_hit * yu_gain_balls
+    else:
+        yu_balls = np.zeros_like(s)
+    
+    return expected_spins, rev_balls, gain_yen, yu_balls
+
+def expectation_components(base, remaining_spins, actual_10r_out=1400.0, model_type="大海4SP"):
+    """
+    Rate-independent parts of calculate_expectation as broadcast arrays:
+    (profit_balls, gain_yen, yu_balls), where
+    EV = profit_balls * yen_per_ball + gain_yen + yu_balls * yen_per_ball.
+    """
+    base, s, actual_10r_out = np.broadcast_arrays(
+        np.asarray(base, dtype=float),
+        np.asarray(remaining_spins, dtype=float),
+        np.asarray(actual_10r_out, dtype=float)
+    )
+    base = np.where(base <= 0, 1.0, base)
+    
+    expected_spins, rev_balls, gain_yen, yu_balls = base_free_terms(s, actual_10r_out, get_model(model_type))
+    
+    # 4. EV Calculation
+    inv_balls = (expected_spins / base) * 250.0
+    profit_balls = rev_balls - inv_balls
+    
+    return profit_balls, gain_yen, yu_balls
+
+def combine_expectation(profit_balls, gain_yen, yu_balls, remaining_spins, exchange_rate):
+    """
+    Converts expectation_components to truncated Yen EV (int64 array),
+    in the same operation order as calculate_expectation.
+    """
+    # 5. Convert to Yen
+    yen_per_ball = 100.0 / np.asarray(exchange_rate, dtype=float)
+    ev_yen = profit_balls * yen_per_ball
+    ev_yen = ev_yen + gain_yen
+    ev_yen = ev_yen + yu_balls * yen_per_ball
+    
+    ev_yen = np.where(np.asarray(remaining_spins, dtype=float) <= 0, 0.0, ev_yen)
+    return np.trunc(ev_yen).astype(np.int64)
+
+def calculate_expectation_batch(base, remaining_spins, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP"):
+    """
+    Array version of calculate_expectation.
+    All numeric arguments may be arrays or scalars (broadcast together).
+    Returns an int64 array equal to calculate_expectation element-wise.
+    """
+    base, s, exchange_rate, actual_10r_out = np.broadcast_arrays(
+        np.asarray(base, dtype=float),
+        np.asarray(remaining_spins, dtype=float),
+        np.asarray(exchange_rate, dtype=float),
+        np.asarray(actual_10r_out, dtype=float)
+    )
+    profit_balls, gain_yen, yu_balls = expectation_components(base, s, actual_10r_out, model_type)
+    return combine_expectation(profit_balls, gain_yen, yu_balls, s, exchange_rate)
+
+def get_estimated_time(remaining_spins, model_type="大海4SP"):
+    """
+    Returns estimated total time (minutes) to finish the session, 
+    based on user-provided simulation data.
+    """
+    model = get_model(model_type)
+    est_min = model.time(float(remaining_spins))
     
     # Floor at 30 mins (avg loop duration if s=0)
-    return max(30.0, est_min)
+    return max(model.time_min, est_min)
+
+def get_estimated_time_batch(remaining_spins, model_type="大海4SP"):
+    """
+    Array version of get_estimated_time.
+    """
+    model = get_model(model_type)
+    return np.maximum(model.time_min, model.time.evaluate(remaining_spins))
 
 def get_expected_hits(remaining_spins, model_type="大海4SP"):
     """
     Returns estimated total hit count (Ren-chan) for the session,
     based on user-provided simulation data.
     """
-    if model_type == "大海5SP":
+    model = get_model(model_type)
+    s = float(remaining_spins)
+    if model.hits_type == "table":
         # Refined points from provided reference images
-        points = [
-            (100, 2.50),
-            (200, 2.70),
-            (300, 2.80),
-            (400, 2.90),
-            (450, 2.90),
-            (500, 2.90)
-        ]
-        s = float(remaining_spins)
-        if s <= 100:
-            p1, p2 = points[0], points[1]
-        elif s >= 500:
-            p1, p2 = points[-2], points[-1]
-        else:
-            p1, p2 = points[0], points[1]
-            for i in range(len(points) - 1):
-                if points[i][0] <= s <= points[i+1][0]:
-                    p1, p2 = points[i], points[i+1]
-                    break
-        slope = (p2[1] - p1[1]) / (p2[0] - p1[0])
-        return p1[1] + (s - p1[0]) * slope
+        return model.hits(s)
+    
+    # Probabilistic model (e.g. 大海4SP)
+    p = model.p
+    p_hit_before = 1.0 - (1.0 - p)**s
+    p_reach_yu = (1.0 - p)**s
+    p_hit_during_yu = 1.0 - (1.0 - p)**model.hits_yu_duration
+    p_total_hit = p_hit_before + (p_reach_yu * p_hit_during_yu)
+    return p_total_hit * model.avg_ren
+
+def break_even_base(remaining_spins, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP",
+                    target_ev=0.0, target_hourly=None, method="closed", base_range=(1.0, 60.0)):
+    """
+    Base at which EV reaches a target, for arrays of remaining spins
+    (all numeric arguments broadcast).
+    target_ev: EV target in Yen (0 = break-even).
+    target_hourly: Yen/hour target instead; scaled by get_estimated_time.
+    method "closed": EV is linear in 1/base, so
+        base = inv_yen_per_unit_base / (revenue_yen - target)
+    method "bisect": vectorized bisection on the (untruncated) EV within base_range.
+    Returns inf where the target cannot be reached at any base, NaN for spins <= 0.
+    """
+    s, exchange_rate, actual_10r_out, target_ev = np.broadcast_arrays(
+        np.asarray(remaining_spins, dtype=float),
+        np.asarray(exchange_rate, dtype=float),
+        np.asarray(actual_10r_out, dtype=float),
+        np.asarray(target_ev, dtype=float)
+    )
+    model = get_model(model_type)
+    target = target_ev
+    if target_hourly is not None:
+        target = target + np.asarray(target_hourly, dtype=float) * get_estimated_time_batch(s, model_type) / 60.0
+    
+    expected_spins, rev_balls, gain_yen, yu_balls = base_free_terms(s, actual_10r_out, model)
+    yen_per_ball = 100.0 / exchange_rate
+    # EV(base) = revenue - cost / base
+    revenue = rev_balls * yen_per_ball + gain_yen + yu_balls * yen_per_ball
+    cost = expected_spins * 250.0 * yen_per_ball
+    
+    if method == "closed":
+        margin = revenue - target
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base = np.where(margin > 0, cost / margin, np.inf)
+    elif method == "bisect":
+        lo = np.full(s.shape, float(base_range[0]))
+        hi = np.full(s.shape, float(base_range[1]))
+        # EV is increasing in base: keep [lo, hi] bracketing the target
+        for _ in range(60):
+            mid = 0.5 * (lo + hi)
+            below = revenue - cost / mid < target
+            lo = np.where(below, mid, lo)
+            hi = np.where(below, hi, mid)
+        base = 0.5 * (lo + hi)
+        base = np.where(revenue - cost / base_range[1] < target, np.inf, base)
     else:
-        # Probabilistic model for other models (e.g. 大海4SP)
-        p = 1.0 / 319.7
-        avg_ren = 2.85
-        yu_duration = 1200
-        
-        s = float(remaining_spins)
-        p_hit_before = 1.0 - (1.0 - p)**s
-        p_reach_yu = (1.0 - p)**s
-        p_hit_during_yu = 1.0 - (1.0 - p)**yu_duration
-        p_total_hit = p_hit_before + (p_reach_yu * p_hit_during_yu)
-        return p_total_hit * avg_ren
+        raise ValueError(f"unknown method: {method}")
+    
+    return np.where(s <= 0, np.nan, base)
 
-def get_base_curve(base, exchange_rate, machine_out, model_type="大海4SP"):
-    points = []
-    for b in [x * 0.5 for x in range(30, 51)]: # 15 to 25
-        val = calculate_expectation(b, 400, exchange_rate, machine_out, model_type)
-        points.append((b, val))
-    return points
+def expectation_surface(bases, spins, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP"):
+    """
+    EV and hourly wage over a (spins x bases) grid in one batch evaluation.
+    Returns (ev, hourly) arrays of shape (len(spins), len(bases)).
+    """
+    bases = np.asarray(bases, dtype=float)
+    spins = np.asarray(spins, dtype=float)
+    ev = calculate_expectation_batch(bases[None, :], spins[:, None], exchange_rate, actual_10r_out, model_type)
+    est_time = get_estimated_time_batch(spins, model_type)[:, None]
+    hourly = np.trunc((ev / est_time) * 60).astype(np.int64)
+    return ev, hourly
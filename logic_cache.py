@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+import logic
+from model_registry import registry_revision
+
+DEFAULT_MAXSIZE = 4096
+
+# Float inputs are snapped to the calculator's st.number_input steps.
+# Values are computed at the snapped inputs, so a cached result never
+# depends on which of several nearby floats filled the slot first.
+QUANT_STEPS = {
+    "base": 0.1,
+    "exchange_rate": 0.1,
+    "actual_10r_out": 1.0,
+    "remaining_spins": 1.0
+}
+
+def quantize(value, step):
+    return round(round(float(value) / step) * step, 6)
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU map with hit/miss/eviction counters.
+    One instance is shared by every Streamlit session in the process.
+    """
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns (found, value).
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize
+            }
+
+_caches = {
+    "calculate_expectation": LRUCache(),
+    "get_estimated_time": LRUCache(),
+    "get_expected_hits": LRUCache()
+}
+
+def _cached(name, key, compute):
+    cache = _caches[name]
+    # Registry revision in the key: reloading models.json never serves stale values
+    key = (registry_revision(),) + key
+    found, value = cache.get(key)
+    if found:
+        return value
+    value = compute()
+    cache.put(key, value)
+    return value
+
+def calculate_expectation(base, remaining_spins, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP"):
+    base = quantize(base, QUANT_STEPS["base"])
+    remaining_spins = quantize(remaining_spins, QUANT_STEPS["remaining_spins"])
+    exchange_rate = quantize(exchange_rate, QUANT_STEPS["exchange_rate"])
+    actual_10r_out = quantize(actual_10r_out, QUANT_STEPS["actual_10r_out"])
+    return _cached(
+        "calculate_expectation",
+        (base, remaining_spins, exchange_rate, actual_10r_out, model_type),
+        lambda: logic.calculate_expectation(base, remaining_spins, exchange_rate, actual_10r_out, model_type)
+    )
+
+def get_estimated_time(remaining_spins, model_type="大海4SP"):
+    remaining_spins = quantize(remaining_spins, QUANT_STEPS["remaining_spins"])
+    return _cached(
+        "get_estimated_time",
+        (remaining_spins, model_type),
+        lambda: logic.get_estimated_time(remaining_spins, model_type)
+    )
+
+def get_expected_hits(remaining_spins, model_type="大海4SP"):
+    remaining_spins = quantize(remaining_spins, QUANT_STEPS["remaining_spins"])
+    return _cached(
+        "get_expected_hits",
+        (remaining_spins, model_type),
+        lambda: logic.get_expected_hits(remaining_spins, model_type)
+    )
+
+def cache_stats():
+    """
+    Returns {function_name: {hits, misses, evictions, size, maxsize}}.
+    """
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+def set_maxsize(maxsize):
+    for cache in _caches.values():
+        cache.resize(maxsize)
+
+def clear_caches():
+    """
+    Drops all memoized values (call after changing model parameters).
+    """
+    for cache in _caches.values():
+        cache.clear()
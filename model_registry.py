@@ -0,0 +1,146 @@
+import bisect
+import json
+import os
+
+import numpy as np
+
+MODELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models.json')
+
+class AnchorTable:
+    """
+    Piecewise-linear interpolator over sorted (spins, value) anchor points.
+    Slopes are precomputed once; lookups use bisect on the spins column.
+    extrapolate=True continues the end segments, False holds the end values.
+    """
+    def __init__(self, points, extrapolate=True):
+        if len(points) < 2:
+            raise ValueError("anchor table needs at least 2 points")
+        self.points = [(p[0], p[1]) for p in sorted(points)]
+        self.xs = [p[0] for p in self.points]
+        self.ys = [p[1] for p in self.points]
+        self.slopes = [(self.ys[i + 1] - self.ys[i]) / (self.xs[i + 1] - self.xs[i])
+                       for i in range(len(self.points) - 1)]
+        self.extrapolate = extrapolate
+        self._xs_arr = np.array(self.xs, dtype=float)
+        self._ys_arr = np.array(self.ys, dtype=float)
+        self._slopes_arr = np.array(self.slopes, dtype=float)
+
+    def __call__(self, s):
+        if not self.extrapolate:
+            if s <= self.xs[0]:
+                return self.ys[0]
+            if s >= self.xs[-1]:
+                return self.ys[-1]
+        # First segment whose closed range contains s; end segments outside the table
+        i = min(max(bisect.bisect_left(self.xs, s) - 1, 0), len(self.slopes) - 1)
+        return self.ys[i] + (s - self.xs[i]) * self.slopes[i]
+
+    def evaluate(self, s):
+        """
+        Array version of __call__ (same segment choice and arithmetic).
+        """
+        s = np.asarray(s, dtype=float)
+        i = np.clip(np.searchsorted(self._xs_arr, s, side='left') - 1, 0, len(self.slopes) - 1)
+        val = self._ys_arr[i] + (s - self._xs_arr[i]) * self._slopes_arr[i]
+        if not self.extrapolate:
+            val = np.where(s <= self.xs[0], self.ys[0], val)
+            val = np.where(s >= self.xs[-1], self.ys[-1], val)
+        return val
+
+class ModelSpec:
+    """
+    Compiled machine model: hit probability, border/gain/time/hit tables
+    and the optional Yu-Time electric support parameters.
+    """
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.aliases = list(spec.get("aliases", []))
+        self.p = 1.0 / spec["p_denominator"]
+        self.std_out = float(spec.get("std_out", 1400.0))
+
+        border = spec["border"]
+        self.border = AnchorTable(border["points"])
+        self.border_min = border.get("min", 2.0)
+        self.border_max = border.get("max", 19.0)
+
+        gain = spec.get("gain")
+        self.gain = AnchorTable(gain["points"], gain.get("extrapolate", True)) if gain else None
+
+        yu = spec.get("yu_support")
+        if yu:
+            self.yu_theoretical_out = yu["theoretical_out"]
+            self.yu_support_spins = yu["support_spins"]
+            self.yu_duration = yu["duration"]
+        self.has_yu_support = bool(yu)
+
+        time_spec = spec["time"]
+        self.time = AnchorTable(time_spec["points"])
+        self.time_min = time_spec.get("min", 30.0)
+
+        hits = spec["hits"]
+        self.hits_type = hits["type"]
+        if self.hits_type == "table":
+            self.hits = AnchorTable(hits["points"])
+        elif self.hits_type == "probabilistic":
+            self.avg_ren = hits["avg_ren"]
+            self.hits_yu_duration = hits["yu_duration"]
+        else:
+            raise ValueError(f"unknown hits type for {name}: {self.hits_type}")
+
+class ModelRegistry:
+    """
+    All models from the data file, looked up by name or alias.
+    Unknown names resolve to the default model (the old if/else fallback).
+    """
+    def __init__(self, data):
+        self.models = {name: ModelSpec(name, spec) for name, spec in data["models"].items()}
+        self.default = self.models[data.get("default", next(iter(self.models)))]
+        self._lookup = {}
+        for model in self.models.values():
+            for alias in model.aliases:
+                self._lookup[alias] = model
+        self._lookup.update(self.models)
+
+    def get(self, model_type):
+        return self._lookup.get(model_type, self.default)
+
+    def has(self, model_type):
+        return model_type in self._lookup
+
+    def names(self):
+        return list(self.models.keys())
+
+_registry = None
+_revision = 0
+
+def load_registry(path=None):
+    with open(path or MODELS_PATH, encoding='utf-8') as f:
+        return ModelRegistry(json.load(f))
+
+def get_registry():
+    """
+    Returns the process-wide registry, loading models.json on first use.
+    """
+    global _registry
+    if _registry is None:
+        _registry = load_registry()
+    return _registry
+
+def reload_models(path=None):
+    """
+    Re-reads the model data file (e.g. after editing anchor tables).
+    """
+    global _registry, _revision
+    _registry = load_registry(path)
+    _revision += 1
+    return _registry
+
+def registry_revision():
+    """
+    Incremented on every reload_models(); lets caches detect changed specs.
+    """
+    return _revision
+
+def get_model(model_type):
+    return get_registry().get(model_type)
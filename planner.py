@@ -0,0 +1,122 @@
+import functools
+
+import numpy as np
+
+import logic
+from model_registry import get_model, registry_revision
+
+STEP_SPINS = 10          # decision granularity (calculator step)
+MAX_SPINS = 1500
+PLAN_BASES = tuple(round(10.0 + 0.1 * i, 1) for i in range(201))   # 10.0 - 30.0
+
+class StopPolicy:
+    """
+    Stop/continue policy over (remaining spins x base).
+    value[i, j]: optimal EV (Yen) at spins[i], bases[j] when playing optimally.
+    play[i, j]: True if playing the next STEP_SPINS spins is optimal.
+    """
+    def __init__(self, model_type, exchange_rate, actual_10r_out, spins, bases, value, play):
+        self.model_type = model_type
+        self.exchange_rate = exchange_rate
+        self.actual_10r_out = actual_10r_out
+        self.spins = spins
+        self.bases = bases
+        self.value = value
+        self.play = play
+        # Largest remaining-spins value from which continuing is optimal, per base
+        has_play = play.any(axis=0)
+        last_play = len(spins) - 1 - np.argmax(play[::-1], axis=0)
+        self.max_play_spins = np.where(has_play, spins[last_play], 0)
+
+    def _index(self, remaining_spins, base):
+        i = int(np.clip(round(float(remaining_spins) / STEP_SPINS), 0, len(self.spins) - 1))
+        j = int(np.clip(np.searchsorted(self.bases, base), 0, len(self.bases) - 1))
+        if j > 0 and abs(self.bases[j - 1] - base) <= abs(self.bases[j] - base):
+            j -= 1
+        return i, j
+
+    def decide(self, remaining_spins, base):
+        """
+        Returns (play, optimal_ev, max_play_spins) for one state.
+        """
+        i, j = self._index(remaining_spins, base)
+        return bool(self.play[i, j]), int(self.value[i, j]), int(self.max_play_spins[j])
+
+def effective_base(observed_base, observed_spins, bases=PLAN_BASES):
+    """
+    Collapses a base belief into the single base the DP needs.
+    Belief: normal around observed_base with sd = base / sqrt(spins)
+    (spins per 250 balls ~ Poisson), on the discretized base grid.
+    Per-spin cost is linear in 1 / base and the belief is not updated
+    during the session, so the optimal policy under the belief is the
+    policy at base = 1 / E[1 / base].
+    """
+    if observed_spins <= 0:
+        return float(observed_base)
+    bases = np.asarray(bases, dtype=float)
+    sd = max(observed_base, 1e-6) / np.sqrt(observed_spins)
+    weights = np.exp(-0.5 * np.square((bases - observed_base) / sd))
+    if weights.sum() <= 0:
+        return float(observed_base)
+    weights /= weights.sum()
+    return float(1.0 / np.sum(weights / bases))
+
+def solve_policy(model_type="大海4SP", exchange_rate=27.0, actual_10r_out=1400.0, bases=PLAN_BASES):
+    """
+    Backward induction over remaining spins 0..MAX_SPINS in STEP_SPINS steps,
+    vectorized over the base grid. Cached per (model, rate, average out).
+
+    Each step plays up to STEP_SPINS spins: with probability q a hit ends the
+    session with value J(s); otherwise the state moves to s - STEP_SPINS.
+    J(s) is implied from the anchor model's base-free revenue R(s) via
+    R(s) = q J(s) + (1 - q) R(s - STEP), so always continuing reproduces
+    calculate_expectation; stopping is worth 0.
+    """
+    return _solve_policy(model_type, round(float(exchange_rate), 1), round(float(actual_10r_out)),
+                         tuple(bases), registry_revision())
+
+@functools.lru_cache(maxsize=64)
+def _solve_policy(model_type, exchange_rate, actual_10r_out, bases, _revision):
+    model = get_model(model_type)
+    p = model.p
+    spins = np.arange(0, MAX_SPINS + 1, STEP_SPINS, dtype=float)
+    bases_arr = np.asarray(bases, dtype=float)
+    yen_per_ball = 100.0 / exchange_rate
+
+    expected_spins, rev_balls, gain_yen, yu_balls = logic.base_free_terms(
+        spins, np.full(spins.shape, float(actual_10r_out)), model)
+    revenue = rev_balls * yen_per_ball + gain_yen + yu_balls * yen_per_ball
+
+    # Per-step hit probability and expected spins actually played in the step
+    no_hit_step = (1.0 - p) ** STEP_SPINS
+    q = 1.0 - no_hit_step
+    step_spins = q / p
+    step_cost = step_spins * 250.0 * yen_per_ball / bases_arr          # (bases,)
+    hit_value = (revenue[1:] - no_hit_step * revenue[:-1]) / q         # J(s) for s >= STEP
+
+    value = np.empty((len(spins), len(bases_arr)))
+    play = np.zeros((len(spins), len(bases_arr)), dtype=bool)
+    # s = 0: ceiling reached, Yu-Time value is collected automatically
+    value[0] = max(revenue[0], 0.0)
+    for i in range(1, len(spins)):
+        cont = q * hit_value[i - 1] - step_cost + no_hit_step * value[i - 1]
+        play[i] = cont > 0
+        value[i] = np.where(play[i], cont, 0.0)
+
+    value.setflags(write=False)
+    play.setflags(write=False)
+    return StopPolicy(model.name, exchange_rate, actual_10r_out, spins.astype(int), bases_arr, value, play)
+
+def plan_session(remaining_spins, base, exchange_rate=27.0, actual_10r_out=1400.0, model_type="大海4SP",
+                 observed_spins=None):
+    """
+    Stop/continue decision for the current state.
+    If observed_spins is given, base is treated as an estimate from that many
+    spins and replaced by effective_base().
+    Returns {"play", "value", "max_play_spins", "base"}.
+    """
+    if observed_spins:
+        base = effective_base(base, observed_spins)
+    policy = solve_policy(model_type, exchange_rate, actual_10r_out)
+    play, value, max_play = policy.decide(remaining_spins, base)
+    return {"play": play, "value": value, "max_play_spins": max_play, "base": base}
@@ -0,0 +1,161 @@
+"""
+Opt-in instrumentation for database.py calls and app.py reruns.
+
+Enabled with PACHINKO_PROFILE=1 (log file: PACHINKO_PROFILE_LOG, default
+profile.jsonl). When disabled nothing is patched and start_run() /
+checkpoint() / end_run() return immediately.
+
+Per rerun it records:
+- wall time per app section (checkpoint style: time since the previous checkpoint)
+- per database function: calls, wall time, SQL statements, rows returned and
+  connections opened (inclusive of nested database calls)
+- run totals of statements / rows / connections
+"""
+import datetime
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+ENV_FLAG = "PACHINKO_PROFILE"
+ENV_LOG = "PACHINKO_PROFILE_LOG"
+DEFAULT_LOG = "profile.jsonl"
+
+# Helpers and context managers whose own timing is meaningless
+EXCLUDE = {"connection", "transaction", "retry_on_busy", "is_busy_error", "window_start"}
+
+_enabled = False
+_log_path = None
+_local = threading.local()
+last_run = None         # summary of the most recently finished run (any thread)
+
+def is_enabled():
+    return _enabled
+
+def enable(module=None, log_path=None):
+    """
+    Instruments a database module (default: database). Idempotent; safe to
+    call again after importlib.reload(database).
+    """
+    global _enabled, _log_path
+    if module is None:
+        import database as module
+    _enabled = True
+    _log_path = log_path
+    _instrument(module)
+
+def enable_from_env(module=None):
+    if os.environ.get(ENV_FLAG, "") not in ("", "0"):
+        enable(module, os.environ.get(ENV_LOG, DEFAULT_LOG))
+    return _enabled
+
+def _frames():
+    return getattr(_local, 'frames', None)
+
+def _count(index, n=1):
+    # index: 0 statements, 1 rows, 2 connections; charged to the run and every open call
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return
+    run["totals"][index] += n
+    for frame in _local.frames:
+        frame[index] += n
+
+def _on_statement(_sql):
+    _count(0)
+
+def _count_row(cursor, row):
+    _count(1)
+    return row
+
+def _wrap(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = getattr(_local, 'run', None)
+        if run is None:
+            return func(*args, **kwargs)
+        frame = [0, 0, 0]
+        _local.frames.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            _local.frames.pop()
+            agg = run["calls"].setdefault(name, {"calls": 0, "ms": 0.0, "statements": 0, "rows": 0, "connections": 0})
+            agg["calls"] += 1
+            agg["ms"] += elapsed
+            agg["statements"] += frame[0]
+            agg["rows"] += frame[1]
+            agg["connections"] += frame[2]
+    wrapper.__profiled__ = True
+    return wrapper
+
+def _instrument(module):
+    if getattr(module._connect, '__profiled__', False):
+        return
+    connect = module._connect
+
+    def _connect(path):
+        conn = connect(path)
+        _count(2)
+        conn.set_trace_callback(_on_statement)
+        conn.row_factory = _count_row
+        return conn
+    _connect.__profiled__ = True
+    module._connect = _connect
+
+    for name, func in list(vars(module).items()):
+        if (name.startswith('_') or name in EXCLUDE or not inspect.isfunction(func)
+                or func.__module__ != module.__name__ or getattr(func, '__profiled__', False)):
+            continue
+        setattr(module, name, _wrap(name, func))
+    # Idle pooled connections predate the hooks
+    module.close_connections()
+
+def start_run(label="rerun"):
+    if not _enabled:
+        return
+    now = time.perf_counter()
+    _local.frames = []
+    _local.run = {"label": label, "start": now, "last": now, "sections": {}, "calls": {}, "totals": [0, 0, 0]}
+
+def checkpoint(section):
+    """
+    Charges the time since the previous checkpoint (or start_run) to section.
+    """
+    run = getattr(_local, 'run', None) if _enabled else None
+    if run is None:
+        return
+    now = time.perf_counter()
+    run["sections"][section] = run["sections"].get(section, 0.0) + (now - run["last"]) * 1000.0
+    run["last"] = now
+
+def end_run():
+    """
+    Finishes the current run, appends it to the JSON-lines log and returns
+    its summary (None when disabled).
+    """
+    global last_run
+    run = getattr(_local, 'run', None) if _enabled else None
+    if run is None:
+        return None
+    _local.run = None
+    statements, rows, connections = run["totals"]
+    summary = {
+        "ts": datetime.datetime.now().isoformat(timespec='milliseconds'),
+        "label": run["label"],
+        "total_ms": round((time.perf_counter() - run["start"]) * 1000.0, 3),
+        "sections": {k: round(v, 3) for k, v in run["sections"].items()},
+        "statements": statements,
+        "rows": rows,
+        "connections": connections,
+        "calls": {k: dict(v, ms=round(v["ms"], 3)) for k, v in sorted(run["calls"].items(), key=lambda kv: -kv[1]["ms"])},
+    }
+    if _log_path:
+        with open(_log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    last_run = summary
+    return summary
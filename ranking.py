@@ -0,0 +1,110 @@
+import numpy as np
+
+import logic
+from model_registry import get_registry
+
+# Below these sample sizes a machine's own numbers are replaced by the island average
+MIN_SPINS = 1000
+MIN_HITS = 10
+
+DEFAULT_BASE = 20.0
+DEFAULT_OUT = 1400.0
+
+def _weighted(t_spins, t_inv, t_hits, t_out):
+    """
+    (base, avg_out) arrays from summed totals; NaN where there is no data.
+    """
+    inv_units = t_inv / 250.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base = np.where(inv_units > 0, t_spins / inv_units, np.nan)
+        out = np.where(t_hits > 0, t_out / t_hits, np.nan)
+    return base, out
+
+def rank_machines(rows, model_groups, remaining_spins, exchange_rate=27.0, default_model=None,
+                  models=None, min_ev=None, sort_by="hourly", min_spins=MIN_SPINS, min_hits=MIN_HITS):
+    """
+    EV / time / hourly wage for every machine of a store, best first.
+    rows: the store's database.get_store_machine_aggregates() rows, so callers
+    can cache them and only this numpy pass re-runs when the inputs change.
+    model_groups: {group_name: [machine_number, ...]} (database.get_store_index()["groups"]);
+    a group name is evaluated with the models.json model of that name or alias.
+    Machines outside any group use default_model (reported as unsupported if None).
+    models: optional list of group names to keep; min_ev: drop rows below this EV.
+    Returns a list of dicts (unsupported models get ev/time/hourly None, sorted last).
+    """
+    if not rows:
+        return []
+
+    group_of = {}
+    for group_name, numbers in model_groups.items():
+        for num in numbers:
+            group_of.setdefault(num, group_name)
+
+    numbers = np.array([r[1] for r in rows])
+    totals = np.array([r[3:7] for r in rows], dtype=float)   # spins, inv, hits, out
+    counts = np.array([r[7] for r in rows])
+    groups = np.array([group_of.get(int(n), "") for n in numbers], dtype=object)
+
+    m_base, m_out = _weighted(*totals.T)
+
+    # Island averages from the same result set (no extra queries)
+    i_base = np.full(len(rows), np.nan)
+    i_out = np.full(len(rows), np.nan)
+    for group_name in set(groups):
+        mask = groups == group_name
+        if not group_name:
+            continue
+        g_base, g_out = _weighted(*totals[mask].sum(axis=0))
+        i_base[mask] = g_base
+        i_out[mask] = g_out
+
+    use_island_base = (totals[:, 0] < min_spins) | np.isnan(m_base)
+    use_island_out = (totals[:, 2] < min_hits) | np.isnan(m_out)
+    base_source = np.where(use_island_base, np.where(np.isnan(i_base), "default", "island"), "machine")
+    base = np.where(use_island_base, i_base, m_base)
+    out = np.where(use_island_out, i_out, m_out)
+    base = np.where(np.isnan(base), DEFAULT_BASE, base)
+    out = np.where(np.isnan(out), DEFAULT_OUT, out)
+
+    registry = get_registry()
+    model_names = np.array([g if g and registry.has(g) else (default_model if not g else None) for g in groups],
+                           dtype=object)
+
+    ev = np.full(len(rows), np.nan)
+    est_time = np.full(len(rows), np.nan)
+    # One batched evaluation per model type
+    for model_type in {m for m in model_names if m}:
+        mask = model_names == model_type
+        ev[mask] = logic.calculate_expectation_batch(base[mask], remaining_spins, exchange_rate, out[mask], model_type)
+        est_time[mask] = logic.get_estimated_time_batch(np.full(mask.sum(), float(remaining_spins)), model_type)
+    with np.errstate(invalid='ignore'):
+        hourly = np.trunc(ev / est_time * 60)
+
+    keep = np.ones(len(rows), dtype=bool)
+    if models:
+        keep &= np.isin(groups, list(models))
+    if min_ev is not None:
+        keep &= ~(ev < min_ev)
+
+    key = hourly if sort_by == "hourly" else ev
+    order = np.lexsort((numbers, -np.nan_to_num(key, nan=-np.inf)))
+
+    result = []
+    for i in order:
+        if not keep[i]:
+            continue
+        supported = not np.isnan(ev[i])
+        result.append({
+            "machine_number": int(numbers[i]),
+            "model": groups[i] or (default_model or ""),
+            "base": float(base[i]),
+            "avg_out": float(out[i]),
+            "base_source": str(base_source[i]),
+            "t_spins": int(totals[i, 0]),
+            "record_count": int(counts[i]),
+            "ev": int(ev[i]) if supported else None,
+            "est_time": float(est_time[i]) if supported else None,
+            "hourly": int(hourly[i]) if supported else None,
+            "remarks": rows[i][2] or ""
+        })
+    return result
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model_registry import get_model
+
+DEFAULT_SPINS = (100, 200, 300, 400, 500, 600)
+CHUNK_SIZE = 100000
+
+def simulation_params(model_type, base=20.0, exchange_rate=27.0, actual_10r_out=1400.0):
+    """
+    Flattens a model's spec into the plain dict the workers need
+    (kept picklable so process-pool workers never touch models.json).
+    """
+    model = get_model(model_type)
+    sim = model.spec.get("simulation", {})
+    if model.has_yu_support:
+        # Net balls per Yu-Time spin from electric support, as in calculate_expectation
+        yu_net_balls = (actual_10r_out - model.yu_theoretical_out) / model.yu_support_spins
+    else:
+        yu_net_balls = 0.0
+    return {
+        "model": model.name,
+        "p": model.p,
+        "continuation": 1.0 - 1.0 / sim.get("avg_ren", 2.85),
+        "yu_spins": int(sim.get("yu_spins", 1200)),
+        "spins_per_minute": sim.get("balls_per_minute", 100.0) * base / 250.0,
+        "yu_spins_per_minute": sim.get("yu_spins_per_minute", 20.0),
+        "minutes_per_hit": sim.get("minutes_per_hit", 3.0),
+        "balls_per_spin": 250.0 / base,
+        "out_per_hit": actual_10r_out,
+        "yu_net_balls": yu_net_balls,
+        "yen_per_ball": 100.0 / exchange_rate
+    }
+
+def _simulate_chunk(params, spins, n, seed_seq):
+    """
+    Plays n sessions for every remaining-spins value (common random numbers
+    across spins values). Returns per-spins sums and sums of squares
+    for (time, hits, ev) as a (3, 2, len(spins)) array.
+    """
+    rng = np.random.default_rng(seed_seq)
+    p = params["p"]
+    s = np.asarray(spins, dtype=np.int64)[None, :]
+
+    # Spins until the first hit in normal play and during Yu-Time
+    first_hit = rng.geometric(p, size=n)[:, None]
+    yu_hit = rng.geometric(p, size=n)[:, None]
+    # Ren-chan length: 1 + geometric number of continuations
+    chain = rng.geometric(1.0 - params["continuation"], size=n)[:, None]
+
+    hit_before = first_hit <= s
+    normal_spins = np.where(hit_before, first_hit, s)
+    hit_in_yu = ~hit_before & (yu_hit <= params["yu_spins"])
+    yu_spins_used = np.where(hit_before, 0, np.where(hit_in_yu, yu_hit, params["yu_spins"]))
+    hits = np.where(hit_before | hit_in_yu, chain, 0)
+
+    minutes = (normal_spins / params["spins_per_minute"]
+               + yu_spins_used / params["yu_spins_per_minute"]
+               + hits * params["minutes_per_hit"])
+    profit_balls = (hits * params["out_per_hit"]
+                    - normal_spins * params["balls_per_spin"]
+                    + yu_spins_used * params["yu_net_balls"])
+    ev_yen = profit_balls * params["yen_per_ball"]
+
+    out = np.empty((3, 2, s.shape[1]))
+    for i, values in enumerate((minutes, hits.astype(float), ev_yen)):
+        out[i, 0] = values.sum(axis=0)
+        out[i, 1] = np.square(values).sum(axis=0)
+    return out
+
+def simulate(model_type, sessions=1000000, spins=DEFAULT_SPINS, base=20.0, exchange_rate=27.0,
+             actual_10r_out=1400.0, seed=0, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Monte Carlo estimate of the session curves for one model.
+    Results depend only on (seed, sessions, chunk_size), not on workers.
+    Returns {"time": [(spins, minutes)], "hits": [(spins, hits)], "ev": [(spins, yen)],
+    "stderr": {...same keys...}, "sessions": n}.
+    """
+    if sessions <= 0:
+        raise ValueError("sessions must be positive")
+    params = simulation_params(model_type, base, exchange_rate, actual_10r_out)
+    spins = [int(x) for x in spins]
+    sizes = [chunk_size] * (sessions // chunk_size)
+    if sessions % chunk_size:
+        sizes.append(sessions % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(params, spins, n, ss) for n, ss in zip(sizes, seeds)]
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_simulate_chunk, *zip(*jobs)))
+    else:
+        parts = [_simulate_chunk(*job) for job in jobs]
+
+    totals = np.sum(parts, axis=0)
+    mean = totals[:, 0] / sessions
+    var = np.maximum(totals[:, 1] / sessions - np.square(mean), 0.0)
+    stderr = np.sqrt(var / sessions)
+
+    curves = {"sessions": sessions, "stderr": {}}
+    for i, key in enumerate(("time", "hits", "ev")):
+        curves[key] = [(s, round(float(v), 4)) for s, v in zip(spins, mean[i])]
+        curves["stderr"][key] = [(s, round(float(v), 4)) for s, v in zip(spins, stderr[i])]
+    return curves
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo session simulator for the anchor tables")
+    parser.add_argument("model", nargs="?", default="大海4SP")
+    parser.add_argument("--sessions", type=int, default=1000000)
+    parser.add_argument("--spins", type=int, nargs="+", default=list(DEFAULT_SPINS))
+    parser.add_argument("--base", type=float, default=20.0)
+    parser.add_argument("--rate", type=float, default=27.0)
+    parser.add_argument("--out", type=float, default=1400.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    if args.sessions <= 0:
+        parser.error("--sessions must be positive")
+
+    result = simulate(args.model, args.sessions, args.spins, args.base, args.rate, args.out,
+                      seed=args.seed, workers=args.workers)
+    # Same [[spins, value], ...] shape as the models.json tables
+    for key in ("time", "hits", "ev"):
+        print(f'"{key}": {json.dumps([[s, round(v, 2)] for s, v in result[key]])}')
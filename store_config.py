@@ -0,0 +1,120 @@
+"""
+Store / island configuration, kept in the database and imported from JSON.
+
+    python store_config.py [store_config.json] [--db pachinko.db]
+
+The file maps store names to their settings:
+
+    {"stores": {"999": {
+        "exchange_rate": 28.0,
+        "rename_from": "Default Store",              (optional)
+        "calculator": {"group": "P大海物語5スペシャル ALTA", "model": "大海5SP",
+                       "default_rate": 27.5, "default_out": 1400},
+        "islands": {"P大海物語5スペシャル ALTA": ["93-100", "141-148"], ...},
+        "machines": [...]                             (optional, machines outside any island)
+    }}}
+
+Machine numbers are integers or "first-last" ranges. A store's machines are
+the union of its islands and "machines". Applying is idempotent: missing
+stores are created (exchange_rate is used only then), machines and islands
+of every listed store are synced, which deletes unlisted machines together
+with their records, and calculator settings are replaced. Stores that are
+not in the file are left alone.
+A running app applies changes made through its own sidebar immediately;
+imports from this script are picked up after a server restart.
+"""
+import argparse
+import json
+import os
+
+import database as db
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "store_config.json")
+
+def expand_numbers(items):
+    numbers = set()
+    for item in items:
+        if isinstance(item, int):
+            numbers.add(item)
+        elif isinstance(item, str) and "-" in item:
+            first, last = (int(part) for part in item.split("-", 1))
+            if first > last:
+                raise ValueError(f"empty range: {item}")
+            numbers.update(range(first, last + 1))
+        else:
+            numbers.add(int(item))
+    return sorted(numbers)
+
+def parse_config(data):
+    """
+    Validates a decoded config and expands machine ranges.
+    Returns {store_name: {exchange_rate, rename_from, calculator, islands, machines}}.
+    Raises ValueError with the offending store on bad input.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("stores"), dict):
+        raise ValueError('config must be an object with a "stores" object')
+    stores = {}
+    for name, spec in data["stores"].items():
+        try:
+            islands = {group: expand_numbers(nums) for group, nums in spec.get("islands", {}).items()}
+            machines = set(expand_numbers(spec.get("machines", [])))
+            for nums in islands.values():
+                machines.update(nums)
+            calc = spec.get("calculator") or {}
+            if not calc.get("group") or not calc.get("model"):
+                raise ValueError('calculator needs "group" and "model"')
+            stores[name] = {
+                "exchange_rate": float(spec.get("exchange_rate", 27.0)),
+                "rename_from": spec.get("rename_from"),
+                "calculator": {
+                    "calc_group": calc["group"],
+                    "calc_model": calc["model"],
+                    "default_rate": None if calc.get("default_rate") is None else float(calc["default_rate"]),
+                    "default_out": int(calc.get("default_out", 1400)),
+                },
+                "islands": islands,
+                "machines": sorted(machines),
+            }
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"store {name}: {e}")
+    return stores
+
+def load_config(path=DEFAULT_PATH):
+    with open(path, encoding="utf-8") as f:
+        return parse_config(json.load(f))
+
+def apply_config(stores):
+    """
+    Writes a parsed config to the database, one transaction per store.
+    Returns {store_name: list of changed islands}.
+    """
+    db.init_db()
+    changed = {}
+    for name, spec in stores.items():
+        with db.transaction():
+            if spec["rename_from"]:
+                db.rename_store(spec["rename_from"], name)
+            db.add_store(name, spec["exchange_rate"])
+            store_id = db.get_store_id(name)
+            db.ensure_machines(store_id, spec["machines"])
+            changed[name] = db.set_model_groups(store_id, spec["islands"])
+            db.set_store_settings(store_id, **spec["calculator"])
+    return changed
+
+def is_seeded():
+    """
+    True once any store has been configured (a store_settings row exists).
+    """
+    with db.connection() as conn:
+        return conn.execute("SELECT 1 FROM store_settings LIMIT 1").fetchone() is not None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import store / island configuration into the database")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--db", default=db.DB_PATH)
+    args = parser.parse_args()
+    db.DB_PATH = args.db
+
+    changed = apply_config(load_config(args.path))
+    for name, groups in changed.items():
+        print(f"{name}: " + (", ".join(groups) + " updated" if groups else "islands unchanged"))
@@ -0,0 +1,168 @@
+"""
+Concurrent multi-writer stress test for database.py.
+
+    python stress_db.py --workers 8 --mode process --ops 500
+
+Spawns N threads or processes against a temporary database, each issuing a
+mix of add_record / delete_record_by_id / restore_last_record and reads.
+Afterwards the record count is checked against the successful operations and
+every running total is checked against a rescan (machines, islands, daily
+rollups). Prints p50/p99 latency per operation and overall throughput;
+exits non-zero on any error or inconsistency.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import database as db
+
+MACHINES = list(range(1, 21))
+GROUPS = {"A": MACHINES[:10], "B": MACHINES[10:]}
+MIX = (("add_record", 0.45), ("delete_record_by_id", 0.1), ("restore_last_record", 0.1),
+       ("read_machine", 0.15), ("read_store", 0.1), ("read_group", 0.1))
+
+def setup(path):
+    db.DB_PATH = path
+    db.init_db()
+    db.add_store("stress", 27.0)
+    db.ensure_machines(1, MACHINES)
+    db.set_model_groups(1, GROUPS)
+
+def worker(path, seed, ops, start_at=None):
+    """
+    Runs ops random operations; returns (latencies {op: [seconds]}, counts, errors, busy_retries).
+    """
+    db.DB_PATH = path
+    rnd = random.Random(seed)
+    names = [name for name, _ in MIX]
+    weights = [w for _, w in MIX]
+    latencies = {name: [] for name in names}
+    counts = {"added": 0, "deleted": 0, "restored": 0}
+    errors = []
+    if start_at:
+        time.sleep(max(0.0, start_at - time.time()))
+
+    for _ in range(ops):
+        op = rnd.choices(names, weights)[0]
+        m = rnd.choice(MACHINES)
+        t0 = time.perf_counter()
+        try:
+            if op == "add_record":
+                db.add_record(1, m, rnd.randint(1, 40) * 250, rnd.randint(1, 900), rnd.randint(0, 5),
+                              rnd.randint(0, 9000), date=f"2026-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}")
+                counts["added"] += 1
+            elif op == "delete_record_by_id":
+                with db.connection() as conn:
+                    max_id = conn.execute("SELECT MAX(id) FROM records").fetchone()[0] or 1
+                if db.delete_record_by_id(rnd.randint(1, max_id)):
+                    counts["deleted"] += 1
+            elif op == "restore_last_record":
+                if db.restore_last_record(1, m):
+                    counts["restored"] += 1
+            elif op == "read_machine":
+                db.get_machine_weighted_stats(1, m)
+                db.get_machine_history(1, m)
+            elif op == "read_store":
+                db.get_all_machines_status(1)
+            else:
+                db.get_group_weighted_stats(1, rnd.choice(list(GROUPS)))
+        except Exception as e:
+            errors.append(f"{op}: {type(e).__name__}: {e}")
+        latencies[op].append(time.perf_counter() - t0)
+    db.close_connections()
+    return latencies, counts, errors, db.busy_retry_count
+
+def run(workers, ops, mode, path):
+    """
+    Returns (results, elapsed seconds, busy retries).
+    """
+    start_at = time.time() + 0.5    # common start once every worker is up
+    jobs = [(path, seed, ops, start_at) for seed in range(workers)]
+    if mode == "process":
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(worker, *zip(*jobs)))
+        elapsed = time.time() - start_at
+        retries = sum(r[3] for r in results)
+    else:
+        # Threads share the module, so the retry counter is read once for all
+        before = db.busy_retry_count
+        results = [None] * workers
+        def target(i):
+            results[i] = worker(*jobs[i])
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start_at
+        retries = db.busy_retry_count - before
+    return results, elapsed, retries
+
+def check_consistency(results):
+    problems = []
+    counts = {"added": 0, "deleted": 0, "restored": 0}
+    for _, cnt, _, _ in results:
+        for k in counts:
+            counts[k] += cnt[k]
+    with db.connection() as conn:
+        n_records = conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    expected = counts["added"] - counts["deleted"] + counts["restored"]
+    if n_records != expected:
+        problems.append(f"records: {n_records} in table, {expected} expected from successful ops")
+    for label, drift in (("machine totals", db.verify_machine_aggregates()),
+                         ("island totals", db.verify_group_aggregates()),
+                         ("daily rollups", db.verify_daily_rollups())):
+        if drift:
+            problems.append(f"{label} drifted: {drift[:5]}")
+    return counts, n_records, problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=500, help="operations per worker")
+    parser.add_argument("--mode", choices=["thread", "process"], default="process")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'stress.db')
+    ok = False
+    try:
+        setup(path)
+        results, elapsed, retries = run(args.workers, args.ops, args.mode, path)
+
+        db.DB_PATH = path
+        counts, n_records, problems = check_consistency(results)
+        errors = [e for _, _, errs, _ in results for e in errs]
+
+        total_ops = args.workers * args.ops
+        print(f"{args.workers} {args.mode}(es) x {args.ops} ops: {total_ops:,} ops in {elapsed:.2f}s "
+              f"({total_ops / elapsed:,.0f} ops/sec), {retries} busy retries")
+        print(f"{'operation':22s} {'count':>7s} {'p50 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+        for name, _ in MIX:
+            lat = np.array([x for lat, _, _, _ in results for x in lat[name]]) * 1000.0
+            if len(lat):
+                print(f"{name:22s} {len(lat):7d} {np.percentile(lat, 50):9.2f} {np.percentile(lat, 99):9.2f} {lat.max():9.2f}")
+        print(f"records: {n_records:,} (added {counts['added']:,}, deleted {counts['deleted']:,}, restored {counts['restored']:,})")
+
+        for e in errors[:10]:
+            print("error:", e)
+        for p in problems:
+            print("INCONSISTENT:", p)
+        ok = not errors and not problems
+        print("OK" if ok else f"FAILED ({len(errors)} errors, {len(problems)} inconsistencies)")
+    finally:
+        db.close_connections()
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
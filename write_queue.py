@@ -0,0 +1,141 @@
+import atexit
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import database as db
+
+QUEUE_SIZE = 1000
+BATCH_SIZE = 200
+
+_STOP = object()
+
+class WriteQueue:
+    """
+    Single background writer for database.py write functions.
+    submit() enqueues a call and returns a Future that resolves after the
+    transaction containing it has committed. Pending calls are drained into
+    one transaction per batch, each inside its own SAVEPOINT so a failing
+    call only rolls back itself. Calls run strictly in submission order
+    (hence also in order per machine).
+    """
+    def __init__(self, maxsize=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._last = {}             # key -> Future of the latest write for that key
+        self._lock = threading.Lock()
+        self._closed = False
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, key=None, timeout=None, **kwargs):
+        """
+        Enqueues func(*args, **kwargs). Blocks while the queue is full
+        (raises queue.Full after timeout, if given).
+        key: e.g. (store_id, machine_number), for wait_for().
+        """
+        if self._closed:
+            raise RuntimeError("write queue is closed")
+        future = Future()
+        self._queue.put((func, args, kwargs, future), timeout=timeout)
+        if key is not None:
+            with self._lock:
+                self._last[key] = future
+        return future
+
+    def wait_for(self, key, timeout=None):
+        """
+        Read-your-writes: blocks until the latest write submitted with key
+        has committed. Returns its result (re-raises its error).
+        """
+        with self._lock:
+            future = self._last.get(key)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                if self._last.get(key) is future:
+                    del self._last[key]
+
+    def flush(self, timeout=None):
+        """
+        Blocks until everything submitted so far has committed.
+        """
+        self.submit(lambda: None).result(timeout)
+
+    def close(self, timeout=None):
+        """
+        Stops accepting writes, commits the pending ones and stops the thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            stop = batch[-1] is _STOP
+            items = [item for item in batch if item is not _STOP]
+            if items:
+                self._commit(items)
+            if stop:
+                return
+
+    def _commit(self, items):
+        runnable = [item for item in items if item[3].set_running_or_notify_cancel()]
+        if not runnable:
+            return
+        try:
+            outcomes = self._run_batch(runnable)
+        except Exception as e:
+            # The batch itself failed to commit: nothing in it is durable
+            for _, _, _, future in runnable:
+                future.set_exception(e)
+            return
+        for (_, _, _, future), (ok, value) in zip(runnable, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    @db.retry_on_busy
+    def _run_batch(self, items):
+        # A busy/locked failure rolls the whole batch back and retries it
+        outcomes = []
+        with db.transaction():
+            for func, args, kwargs, _ in items:
+                try:
+                    with db.transaction():
+                        outcomes.append((True, func(*args, **kwargs)))
+                except Exception as e:
+                    outcomes.append((False, e))
+        return outcomes
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_write_queue():
+    """
+    Process-wide writer (recreated after fork), flushed at interpreter exit.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = WriteQueue()
+            atexit.register(_writer.close)
+        return _writer